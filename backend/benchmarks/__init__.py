@@ -0,0 +1,10 @@
+# Prefix of the scratch databases the benchmarks are allowed to drop
+SCRATCH_DATABASE_PREFIX = "bench_"
+
+def check_scratch_database(name: str, yes_drop: bool):
+    '''Refuse to run against a database that doesn't look like a scratch one, unless dropping it was confirmed.'''
+    if not name.startswith(SCRATCH_DATABASE_PREFIX) and not yes_drop:
+        raise SystemExit(
+            f"`{name}` would be dropped: scratch database names start with `{SCRATCH_DATABASE_PREFIX}`, "
+            "pass --yes-drop to use it anyway."
+        )
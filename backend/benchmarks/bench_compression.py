@@ -0,0 +1,87 @@
+'''
+Benchmark of the response compression: body size & the time spent compressing / decompressing, for each
+available encoding & level, on representative list responses. The estimated latency adds the time to send
+the body over the given link speeds, to show where compressing pays for itself.
+
+Usage (from the backend directory): python -m benchmarks.bench_compression --rounds 20
+'''
+import argparse
+import datetime as dt
+import gzip
+import json
+import time
+from bson import ObjectId
+from fastapi import status
+from data.models.stock import StockStatusEnum
+from benchmarks.bench_response_encoding import make_stocks
+from utils.util import MongoJSONResponse
+from utils.compression import brotli, zstandard
+
+LINK_MBPS = (10, 100, 1000)
+
+def make_events(count: int) -> list[dict]:
+    now = dt.datetime.utcnow()
+    return [{
+        "_id": ObjectId(), "serial": f"SN{i // 3:09d}", "config_id": str(ObjectId()), "status": StockStatusEnum.sold,
+        "from_status": StockStatusEnum.new, "date": now, "user": "owner", "remarks": ""
+    } for i in range(count)]
+
+def envelope(documents: list[dict]) -> bytes:
+    return MongoJSONResponse(content={
+        "content": documents, "message": "Request was successful", "status_code": status.HTTP_200_OK, "next_cursor": None
+    }).body
+
+def payloads() -> dict[str, bytes]:
+    # Stocks no longer embed their status history (it lives in `stock_events`)
+    stocks = [{k: v for k, v in stock.items() if k != "status_history"} for stock in make_stocks(1000)]
+    return {
+        "single_stock": envelope(stocks[:1]),
+        "stock_page_100": envelope(stocks[:100]),
+        "stock_page_1000": envelope(stocks),
+        "history_page_1000": envelope(make_events(1000)),
+    }
+
+def codecs() -> dict[str, tuple]:
+    '''Encoding & level -> (compress, decompress).'''
+    found = {f"gzip-{level}": (lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0), gzip.decompress) for level in (1, 5, 9)}
+    if brotli is not None:
+        found.update({f"br-{q}": (lambda body, q=q: brotli.compress(body, quality=q), brotli.decompress) for q in (1, 4, 11)})
+    if zstandard is not None:
+        found.update({
+            f"zstd-{level}": (zstandard.ZstdCompressor(level=level).compress, zstandard.ZstdDecompressor().decompress) for level in (1, 3, 9)
+        })
+    return found
+
+def best_of(function, body: bytes, rounds: int) -> tuple[float, bytes]:
+    best, result = float("inf"), b""
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function(body)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def transfer_ms(size: int, mbps: int) -> float:
+    return size * 8 / (mbps * 1e6) * 1000
+
+def measure(body: bytes, rounds: int) -> dict:
+    results = {"identity": {"bytes": len(body), **{f"latency_ms_at_{mbps}mbps": round(transfer_ms(len(body), mbps), 3) for mbps in LINK_MBPS}}}
+    for name, (compress, decompress) in codecs().items():
+        compress_seconds, compressed = best_of(compress, body, rounds)
+        decompress_seconds, _ = best_of(decompress, compressed, rounds)
+        overhead_ms = (compress_seconds + decompress_seconds) * 1000
+        results[name] = {
+            "bytes": len(compressed), "ratio": round(len(body) / len(compressed), 2),
+            "compress_ms": round(compress_seconds * 1000, 3), "decompress_ms": round(decompress_seconds * 1000, 3),
+            **{f"latency_ms_at_{mbps}mbps": round(overhead_ms + transfer_ms(len(compressed), mbps), 3) for mbps in LINK_MBPS}
+        }
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "rounds": args.rounds, "brotli": brotli is not None, "zstandard": zstandard is not None,
+        "payloads": {name: measure(body, args.rounds) for name, body in payloads().items()}
+    }, indent=2))
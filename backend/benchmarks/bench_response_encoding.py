@@ -0,0 +1,70 @@
+'''
+Microbenchmark for the list response encoding. Compares the previous path (`_id_cleanup` + 
+`jsonable_encoder` + `JSONResponse`) against `MongoJSONResponse` on stock-like documents.
+
+Usage (from the backend directory): python -m benchmarks.bench_response_encoding --documents 10000
+'''
+import argparse
+import copy
+import datetime as dt
+import json
+import time
+from bson import ObjectId
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from data.models.stock import StockStatusEnum
+from utils.util import ResponseModel, MongoJSONResponse
+
+def make_stocks(count: int) -> list[dict]:
+    now = dt.datetime.utcnow()
+    return [{
+        "_id": ObjectId(), "brand": "Honor", "model": "Honor Magicbook", "model_number": "FRI-F56",
+        "screen_size": "14 inches", "hdd_size": "512 GB", "ssd_size": "NA", "processor_type": "Intel Core i5-12450H",
+        "processor_speed": "4.4 GHz ", "RAM": "16 GB", "graphics_type": "Intel UHD Integrated GDDR4",
+        "graphics_memory": "NA", "OS": "Windows 11 Home", "price": 49990.0 + i, "warranty_years": 2.0,
+        "serial": f"SN{i:09d}", "purchase_date": now, "remarks": "In excellent working condition",
+        "current_status": StockStatusEnum.sold, "create_date": now, "created_by": "owner",
+        "update_date": None, "updated_by": None,
+        "status_history": [{"status": StockStatusEnum.new, "date": now}, {"status": StockStatusEnum.sold, "date": now}]
+    } for i in range(count)]
+
+def legacy_response(documents: list[dict]) -> bytes:
+    return JSONResponse(content={
+        "content": jsonable_encoder(ResponseModel._id_cleanup(documents)),
+        "message": "Request was successful", "status_code": status.HTTP_200_OK
+    }).body
+
+def mongo_json_response(documents: list[dict]) -> bytes:
+    return MongoJSONResponse(content={
+        "content": documents, "message": "Request was successful", "status_code": status.HTTP_200_OK
+    }).body
+
+def measure(encoder, documents: list[dict], rounds: int) -> dict:
+    timings: list[float] = []
+    for _ in range(rounds):
+        # `_id_cleanup` modifies the documents in place, every round gets fresh ones
+        batch = copy.deepcopy(documents)
+        start = time.perf_counter()
+        body = encoder(batch)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "best_seconds": round(best, 6), "mean_seconds": round(sum(timings) / len(timings), 6),
+        "documents_per_second": round(len(documents) / best), "body_bytes": len(body)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    documents = make_stocks(args.documents)
+    legacy = measure(legacy_response, documents, args.rounds)
+    mongo_json = measure(mongo_json_response, documents, args.rounds)
+    print(json.dumps({
+        "documents": args.documents, "rounds": args.rounds,
+        "jsonable_encoder": legacy, "mongo_json_response": mongo_json,
+        "speedup": round(legacy["best_seconds"] / mongo_json["best_seconds"], 2)
+    }, indent=2))
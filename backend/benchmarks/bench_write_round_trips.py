@@ -0,0 +1,104 @@
+'''
+Benchmark for the write paths of the mutating endpoints against a live mongod. Every pattern is
+run twice: the way the endpoint used to do it (write, then read the result back) and the way it
+does it now (response built from the written documents / find_one_and_update). The scratch
+database is dropped at the end, the connection string is never taken from the app's settings.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_write_round_trips --url mongodb://localhost:27017 --iterations 500
+'''
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from uuid import uuid4
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from benchmarks import check_scratch_database
+
+def config_document() -> dict:
+    return {
+        "brand": "Honor", "model": "Honor Magicbook", "model_number": "FRI-F56", "screen_size": "14 inches",
+        "hdd_size": "512 GB", "ssd_size": "NA", "processor_type": "Intel Core i5-12450H", "processor_speed": "4.4 GHz ",
+        "RAM": "16 GB", "graphics_type": "Intel UHD Integrated GDDR4", "graphics_memory": "NA", "OS": "Windows 11 Home",
+        "price": 49990.0, "warranty_years": 2, "cloned_stocks": []
+    }
+
+def stock_documents(count: int) -> list[dict]:
+    return [{**config_document(), "serial": str(uuid4()), "current_status": "new"} for _ in range(count)]
+
+async def insert_then_find(collection):
+    inserted = await collection.insert_one(config_document())
+    return await collection.find_one({"_id": inserted.inserted_id})
+
+async def insert_only(collection):
+    document = config_document()
+    await collection.insert_one(document)
+    return document
+
+async def insert_many_then_find(collection):
+    inserted = await collection.insert_many(stock_documents(5), ordered=False)
+    return [d async for d in collection.find({"_id": {"$in": inserted.inserted_ids}})]
+
+async def insert_many_only(collection):
+    documents = stock_documents(5)
+    await collection.insert_many(documents, ordered=False)
+    return documents
+
+async def update_then_find(collection):
+    await collection.update_one({"username": "bench"}, {"$set": {"disabled": False}}, upsert=True)
+    return await collection.find_one({"username": "bench"})
+
+async def find_one_and_update(collection):
+    return await collection.find_one_and_update(
+        {"username": "bench"}, {"$set": {"disabled": False}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+
+# Endpoint -> (collection, previous write path, current write path)
+PATTERNS = {
+    "add_config / clone_config": ("asset_config", insert_then_find, insert_only),
+    "create_user": ("user", insert_then_find, insert_only),
+    "create_stocks / sell_stock (5 items)": ("stock", insert_many_then_find, insert_many_only),
+    "update_user / swap_stock": ("user", update_then_find, find_one_and_update),
+}
+
+async def measure(collection, pattern, iterations: int) -> dict:
+    latencies: list[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await pattern(collection)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean_ms": round(statistics.mean(latencies), 3), "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3)
+    }
+
+async def main(args):
+    check_scratch_database(args.database, args.yes_drop)
+    client = AsyncIOMotorClient(args.url)
+    db = client.get_database(args.database)
+    report = {}
+    try:
+        for endpoint, (collection_name, previous, current) in PATTERNS.items():
+            collection = db.get_collection(collection_name)
+            before = await measure(collection, previous, args.iterations)
+            after = await measure(collection, current, args.iterations)
+            report[endpoint] = {
+                "read_after_write": before, "single_round_trip": after,
+                "p50_reduction_pct": round(100 * (1 - after["p50_ms"] / before["p50_ms"]), 1)
+            }
+    finally:
+        await client.drop_database(args.database)
+        client.close()
+
+    print(json.dumps({"iterations": args.iterations, "endpoints": report}, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--url", required=True, help="Connection string of the mongod to benchmark against.")
+    parser.add_argument("--database", default="bench_write_round_trips", help="Scratch database, dropped at the end.")
+    parser.add_argument("--yes-drop", action="store_true", help="Allow a database name without the `bench_` prefix.")
+    asyncio.run(main(parser.parse_args()))
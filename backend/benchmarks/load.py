@@ -0,0 +1,274 @@
+'''
+Load test of the API against a live mongod (a replica set, the sale endpoints use transactions).
+Seeds a scratch database with configs, stocks & sales (along with the events, counters, rollups &
+collection versions that the write paths maintain), then drives concurrent clients through a
+weighted mix of login, GET /stock (with filters), POST /sale & PATCH /sale/swap. Throughput and
+p50/p95/p99 latencies per endpoint are printed as JSON, to compare between commits.
+
+By default the app is served in-process (the clients & the app share the event loop, so compare
+runs made the same way). Pass `--base-url` to target a running server instead, it must be started
+with `MONGO_URI` & `MONGO_DATABASE` set to the `--url` & `--database` seeded here. The scratch database is
+dropped at the end unless `--keep-data`, it is always dropped before seeding. The connection string is never
+taken from the app's settings.
+
+Usage (from the backend directory):
+    python -m benchmarks.load --url "mongodb://localhost:27017/?replicaSet=rs0" --configs 20 --stocks 5000 --sales 1000 --requests 5000 --concurrency 32
+'''
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from uuid import uuid4
+import datetime as dt
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.util import settings
+from benchmarks import check_scratch_database
+from utils.security import HashUtil
+from utils.specs import normalize_specs
+from data.db.client import mongo_client
+from data.db.stock_events import record_events
+from data.db.inventory_counters import check_counters
+from data.db.sale_rollup import rebuild_sale_rollups
+from data.db.collection_versions import bump_versions
+
+USERNAME, PASSWORD = "loadtest", "loadtest-password"
+
+BRANDS = ["Acer", "Asus", "Dell", "HP", "Honor", "Lenovo"]
+PROCESSORS = ["Intel Core i3-1215U", "Intel Core i5-12450H", "Intel Core i7-1255U", "AMD Ryzen 5 5500U", "AMD Ryzen 7 5800H"]
+RAMS = ["8 GB", "16 GB", "32 GB"]
+SSDS = ["NA", "256 GB", "512 GB", "1 TB"]
+SYSTEMS = ["Windows 11 Home", "Windows 11 Pro", "Ubuntu 22.04"]
+
+# Filters sent by the GET /stock requests, picked at random
+STOCK_QUERIES = [
+    {"q": "current_status:new,refurbished", "sort": "-purchase_date"},
+    {"q": "brand:Acer,Dell;price:..60000"},
+    {"q": "current_status:new;RAM_gb:>=16;ssd_size_gb:>=512", "sort": "price"},
+    {"q": "(brand:HP | processor_type:AMD*);!current_status:sold,deleted"},
+    {"in_filters": "brand=Lenovo", "price_filter": "40000,80000", "limit": "20"},
+]
+
+def config_document(rng: random.Random) -> dict:
+    brand = rng.choice(BRANDS)
+    return normalize_specs({
+        "brand": brand, "model": f"{brand} {rng.choice(['Aspire', 'Vivobook', 'Inspiron', 'Pavilion', 'Magicbook', 'Ideapad'])}",
+        "model_number": f"M-{rng.randint(100, 999)}", "screen_size": rng.choice(["14 inches", "15.6 inches"]),
+        "hdd_size": "NA", "ssd_size": rng.choice(SSDS), "processor_type": rng.choice(PROCESSORS),
+        "processor_speed": f"{rng.choice([2.4, 3.6, 4.4])} GHz", "RAM": rng.choice(RAMS),
+        "graphics_type": "Integrated", "graphics_memory": "NA", "OS": rng.choice(SYSTEMS),
+        "price": float(rng.randrange(30000, 120000, 500)), "warranty_years": 1.0, "cloned_stocks": [],
+        "create_date": dt.datetime.utcnow(), "created_by": USERNAME
+    })
+
+async def seed(db, args, rng: random.Random) -> tuple[list[str], list[str]]:
+    '''
+    Seed the scratch database, returns the serials available for sale & those already sold. The documents
+    derived from the stocks & sales are written by the same helpers & jobs as the app's, through `mongo_client`.
+    '''
+    await db.user.insert_one({
+        "username": USERNAME, "password": HashUtil.get_password_hash(PASSWORD), "type": "owner", "disabled": False
+    })
+
+    configs = [config_document(rng) for _ in range(args.configs)]
+    await db.asset_config.insert_many(configs)
+
+    now = dt.datetime.utcnow()
+    stocks: list[dict] = []
+    for i in range(args.stocks):
+        config = rng.choice(configs)
+        stock = {k: v for k, v in config.items() if k not in ("_id", "cloned_stocks")}
+        stocks.append({
+            **stock, "serial": str(uuid4()), "config_id": str(config["_id"]), "remarks": "",
+            "purchase_date": now - dt.timedelta(days=rng.randint(0, 365)),
+            "current_status": "sold" if i < args.sales else "new", "status_date": now
+        })
+    for i in range(0, len(stocks), 1000):
+        await db.stock.insert_many(stocks[i:i + 1000], ordered=False)
+        await record_events(stocks[i:i + 1000], {"AH_USER": USERNAME}, date=now)
+
+    sold = stocks[:args.sales]
+    if sold:
+        await db.sale.insert_many([
+            {
+                "serial": stock["serial"], "price": stock["price"], "sale_date": now - dt.timedelta(days=rng.randint(0, 90)),
+                "customer_name": "Load Test", "mobile": "+91 9999999999", "address": "NA", "remarks": "",
+                "create_date": now, "created_by": USERNAME
+            }
+            for stock in sold
+        ], ordered=False)
+
+    await check_counters(fix=True)
+    await rebuild_sale_rollups()
+    await bump_versions("user", "asset_config", "stock", "stock_events", "sale")
+    return [s["serial"] for s in stocks[args.sales:]], [s["serial"] for s in sold]
+
+class Scenario:
+    '''Requests of the mix, each returns the response (or None when it had nothing left to work on).'''
+
+    def __init__(self, client: httpx.AsyncClient, available: list[str], sold: list[str], rng: random.Random):
+        self.client, self.available, self.sold, self.rng = client, available, sold, rng
+        self.token = ""
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def login(self):
+        response = await self.client.post("/user/login", data={"username": USERNAME, "password": PASSWORD})
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+        return response
+
+    async def list_stock(self):
+        return await self.client.get("/stock/", params=self.rng.choice(STOCK_QUERIES), headers=self.headers)
+
+    async def sell(self):
+        if not self.available:
+            return None
+        serial = self.available.pop()
+        response = await self.client.post("/sale/", headers=self.headers, json={
+            "customer_name": "Load Test", "mobile": "+91 9999999999", "address": "NA", "remarks": "",
+            "sale_date": dt.datetime.utcnow().isoformat(), "sales": [{"serial": serial, "price": 50000.0}]
+        })
+        if response.status_code == 200:
+            self.sold.append(serial)
+        return response
+
+    async def swap(self):
+        if not self.available or not self.sold:
+            return None
+        sold_serial = self.sold.pop(self.rng.randrange(len(self.sold)))
+        exchange_with = self.available.pop()
+        response = await self.client.patch("/sale/swap", headers=self.headers, params={
+            "sold_serial": sold_serial, "exchange_with_serial": exchange_with, "return_remarks": "load test"
+        })
+        self.sold.append(exchange_with if response.status_code == 200 else sold_serial)
+        return response
+
+def percentile(latencies: list[float], pct: float) -> float:
+    '''Nearest rank percentile of sorted latencies.'''
+    return latencies[max(0, min(len(latencies) - 1, int(round(pct / 100 * len(latencies))) - 1))]
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies), "errors": errors, "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies), 2), "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2), "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2)
+    }
+
+async def drive(client: httpx.AsyncClient, args, available: list[str], sold: list[str]) -> dict:
+    mix = {name.strip(): float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = [name for name in mix if name not in ("login", "list_stock", "sell", "swap")]
+    if unknown:
+        raise SystemExit(f"Unknown requests in --mix: {', '.join(unknown)}")
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    remaining = args.requests
+
+    async def worker(worker_id: int):
+        nonlocal remaining
+        rng = random.Random(args.seed + worker_id)
+        scenario = Scenario(client, available, sold, rng)
+        await scenario.login()
+        while remaining > 0:
+            remaining -= 1
+            name = rng.choices(list(mix), weights=list(mix.values()))[0]
+            start = time.perf_counter()
+            try:
+                response = await getattr(scenario, name)()
+            except httpx.HTTPError:
+                errors[name] += 1
+                continue
+            if response is None:
+                continue
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 500 or (response.status_code >= 400 and name != "list_stock"):
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total": summarize([l for ls in latencies.values() for l in ls], sum(errors.values()), elapsed),
+        "endpoints": {name: summarize(latencies[name], errors[name], elapsed) for name in mix}
+    }
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args):
+    check_scratch_database(args.database, args.yes_drop)
+    rng = random.Random(args.seed)
+    # Before the app is imported, so that it connects to the scratch database too
+    settings["MONGO_URI"] = args.url
+    settings["MONGO_DATABASE"] = args.database
+    seed_client = AsyncIOMotorClient(args.url)
+    await seed_client.drop_database(args.database)
+
+    seed_start = time.perf_counter()
+    await mongo_client.establish_connection(args.url)
+    try:
+        available, sold = await seed(mongo_client.db, args, rng)
+    finally:
+        await mongo_client.close_connection()
+    seed_elapsed = time.perf_counter() - seed_start
+
+    app = None
+    try:
+        if args.base_url:
+            client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        else:
+            from main import app
+            await app.router.startup()
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=args.timeout)
+
+        async with client:
+            result = await drive(client, args, available, sold)
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+        if not args.keep_data:
+            await seed_client.drop_database(args.database)
+        seed_client.close()
+
+    report = {
+        "commit": git_commit(), "target": args.base_url or "in-process", "concurrency": args.concurrency, "mix": args.mix,
+        "seed": {"configs": args.configs, "stocks": args.stocks, "sales": args.sales, "elapsed_s": round(seed_elapsed, 2)},
+        **result
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", type=int, default=20)
+    parser.add_argument("--stocks", type=int, default=5000)
+    parser.add_argument("--sales", type=int, default=1000, help="Stocks seeded as sold, along with their sales.")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests issued across all the clients.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of concurrent clients.")
+    parser.add_argument("--mix", default="login=1,list_stock=12,sell=4,swap=3", help="Relative weights of the requests.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed, keeps the data & the request sequence reproducible.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds.")
+    parser.add_argument("--base-url", default="", help="URL of a running server, the app is served in-process when not provided.")
+    parser.add_argument("--url", required=True, help="Connection string of the mongod (replica set) to load.")
+    parser.add_argument("--database", default="bench_load", help="Scratch database, dropped before seeding & at the end.")
+    parser.add_argument("--yes-drop", action="store_true", help="Allow a database name without the `bench_` prefix.")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the scratch database after the run, ex: to inspect it.")
+    parser.add_argument("--output", default="", help="Also write the JSON report to this file.")
+    asyncio.run(main(parser.parse_args()))
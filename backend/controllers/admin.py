@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, Query, status
+from data.db.client import mongo_client
+from data.db.indexes import advise_indexes
+from data.db.sale_rollup import rebuild_sale_rollups
+from data.db.inventory_counters import check_counters
+from data.db.slow_queries import slow_query_recorder
+from data.db.config_cache import config_cache
+from data.db.stock_feed import stock_feed
+from utils.util import ResponseModel
+from utils.security import UserUtil, JWTUtil, HashUtil
+
+admin_router = APIRouter(
+    prefix="/admin",
+    tags=["admin"]
+)
+
+@admin_router.get("/indexes", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_atleast_admin)])
+async def get_index_report(uncovered_only: bool = False):
+    '''
+    Lists the query shapes that the list filters can generate (along with those observed at runtime) 
+    and the index serving each of them. Shapes with coverage `none` result in collection scans.
+    '''
+    report = await advise_indexes(mongo_client.db)
+    if uncovered_only:
+        report = [shape for shape in report if shape["coverage"] != "full"]
+    return ResponseModel(content=report)
+
+@admin_router.get("/stats", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_atleast_admin)])
+async def get_runtime_stats():
+    '''Runtime counters of the in-process caches & pools for the worker that serves this request.'''
+    return ResponseModel(content={
+        "principal_cache": JWTUtil.principal_cache.stats(),
+        "config_cache": config_cache.stats(),
+        "stock_feed": stock_feed.stats(),
+        "password_hashing": HashUtil.stats()
+    })
+
+@admin_router.post("/rollups/sale", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_owner)])
+async def rebuild_sale_analytics():
+    '''Rebuild the sales analytics rollups from scratch. Only owners have access to this API.'''
+    buckets = await rebuild_sale_rollups()
+    return ResponseModel(content={"buckets": buckets}, message="Sale rollups rebuilt successfully.")
+
+@admin_router.post("/counters/inventory", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_owner)])
+async def check_inventory_counters(fix: bool = False):
+    '''Recount the stocks per config & status and report the counters that drifted, optionally fixing them.'''
+    drift = await check_counters(fix=fix)
+    return ResponseModel(content=drift, message=f"{len(drift)} counter(s) drifted{', fixed' if fix and drift else ''}.")
+
+@admin_router.get("/slow-queries", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_owner)])
+async def get_slow_queries(
+        top: int = Query(20, ge=1, le=256, description="Number of query shapes to return."),
+        sort_by: str = Query("total_ms", description="Ranking of the shapes.<br>Allowed: `total_ms`, `max_ms`, `count`")
+    ):
+    '''
+    Mongo commands slower than `SLOW_QUERY_THRESHOLD_MS`, grouped by their shape (values redacted) along with the
+    routes that issued them & the explain summary when `SLOW_QUERY_EXPLAIN` is on. Counted for the worker that serves
+    this request. Only owners have access to this API.
+    '''
+    if sort_by not in ("total_ms", "max_ms", "count"):
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Sort field `{sort_by}` is not supported.")
+    return ResponseModel(content=slow_query_recorder.top(top, sort_by))
+
+@admin_router.delete("/slow-queries", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_owner)])
+async def reset_slow_queries():
+    '''Clear the slow query log of the worker that serves this request. Only owners have access to this API.'''
+    slow_query_recorder.reset()
+    return ResponseModel(message="Slow query log cleared.")
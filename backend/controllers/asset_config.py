@@ -3,7 +3,12 @@ from data.db.client import mongo_client
 from data.models.asset_config import AssetConfig, UpdateAssetConfig
 from data.models.user import User
 import datetime as dt
-from utils.util import ResponseModel, get_class_attributes, parse_projections, parse_filters
+from utils.util import ResponseModel, parse_sort, paginate, PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX
+from utils.filters import parse_projections, compile_filter, legacy_query
+from utils.specs import normalize_specs
+from utils.conditional import ConditionalGet
+from data.db.collection_versions import bump_versions
+from data.db.config_cache import config_cache
 from utils.security import UserUtil
 from bson import ObjectId
 from urllib.parse import unquote
@@ -13,24 +18,40 @@ asset_config_router = APIRouter(
     tags=["asset-config"]
 )
 
-@asset_config_router.get(path="/", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated)])
+# Fields that the listing can be sorted on, each of these must be backed by an index
+SORTABLE_FIELDS = ["_id", "brand", "price"]
+
+@asset_config_router.get(path="/", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated), Depends(ConditionalGet("asset_config"))])
 async def get_configurations(
         fields: str = Query("", description="Fields to display.<br>Format: `field1,field2,..`"), 
+        q: str = Query("", description=(
+            'Filter query, combined with the filters below.<br>Format: `brand:Acer,Dell;price:40000..60000;RAM_gb:>=16;ssd_size_gb:>=512`')),
         in_filters: str = Query("", description="Filter by field matches.<br>Format: `brand=Acer.Dell, OS=windows`"),
         price_filter: str = Query("", description=(
             'Filter by price bounds (boundary included). Will take precedence over __in_filters__ if provided.' + 
-            '<br>Format: Between 10000 and 20000 -> `10000,20000` (or) >= 100000 -> `100000`'))
+            '<br>Format: Between 10000 and 20000 -> `10000,20000` (or) >= 100000 -> `100000`')),
+        sort: str = Query("_id", description=f"Sort order, prefix with `-` for descending.<br>Allowed: `{', '.join(SORTABLE_FIELDS)}`"),
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX, description="Maximum number of configurations to return."),
+        after: str = Query("", description="Cursor returned as `next_cursor` by the previous page.")
     ):
 
-    '''Get Configuration(s).'''
-    
-    attrs = get_class_attributes(AssetConfig)
-    filters = parse_filters(attrs, unquote(in_filters), price_filter, price_field_name="price", dt_field_name="sale_date")
-    projection = parse_projections(fields, attrs)
+    '''Get Configuration(s), paginated using `next_cursor`.'''
     
-    configs: list[dict] = [config async for config in mongo_client.asset_config.find(filters, projection)]
+    projection = parse_projections(fields, AssetConfig)
+    try:
+        query = ";".join(filter(None, [q, legacy_query(unquote(in_filters), price_filter)]))
+        filters, sort_order = compile_filter(AssetConfig, query), parse_sort(sort, SORTABLE_FIELDS)
+
+        # Read from the primary, the cache is only invalidated on changes & mustn't keep a lagging secondary's page
+        configs, next_cursor = await config_cache.list_configs(
+            (fields, query, sort_order, limit, after),
+            lambda: paginate(mongo_client.asset_config, filters, projection, sort_order, limit, after)
+        )
+    except ValueError as e:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=str(e))
+
     if len(configs):
-        return ResponseModel(content=configs)
+        return ResponseModel(content=configs, next_cursor=next_cursor)
     else:
         return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message="No relevant results were found.")
 
@@ -41,8 +62,11 @@ async def add_config(config: AssetConfig, user: User = Depends(UserUtil.is_authe
     config.create_date = user["AH_DATE"]()
     config.created_by = user["AH_USER"]
 
-    inserted = await mongo_client.asset_config.insert_one(config.dict())
-    new_config = await mongo_client.asset_config.find_one({"_id": inserted.inserted_id})
+    # insert_one adds the generated `_id` to the document, no need to read it back
+    new_config = normalize_specs(config.dict())
+    await mongo_client.asset_config.insert_one(new_config)
+    config_cache.invalidate(new_config["_id"])
+    await bump_versions("asset_config")
     return ResponseModel(
         content=new_config, 
         message="Configuration has been successfully added",
@@ -62,12 +86,15 @@ async def update_config(id: str, config: UpdateAssetConfig = Body(...), user: Us
         old = await mongo_client.asset_config.find_one({"_id": ObjectId(id)})
         if old:
             old.update(config_to_update)
+            normalize_specs(old)
 
             # Add the audit fields
             old["update_date"] = user["AH_DATE"]()
             old["updated_by"] = user["AH_USER"]
 
             update_result = await mongo_client.asset_config.update_one({"_id": ObjectId(id)}, {"$set": old})
+            config_cache.invalidate(id)
+            await bump_versions("asset_config")
             if update_result:
                 return ResponseModel(content=old, message=f"Update on Object ID {id} was successful.")
             else:
@@ -85,15 +112,17 @@ async def clone_config(id: str, config: UpdateAssetConfig = Body(...), user: Use
         clone = await mongo_client.asset_config.find_one({"_id": ObjectId(id)})
         if clone:
             clone.update(config_to_update)
+            normalize_specs(clone)
             clone.pop("_id", None)
 
             # Add the audit fields
             clone["create_date"] = user["AH_DATE"]()
             clone["created_by"] = user["AH_USER"]
 
-            insert_result = await mongo_client.asset_config.insert_one(clone)
-            new_config = await mongo_client.asset_config.find_one({"_id": insert_result.inserted_id})
-            return ResponseModel(content=new_config, message=f"Cloned from Object ID {id} successfully.", status_code=status.HTTP_200_OK)
+            await mongo_client.asset_config.insert_one(clone)
+            config_cache.invalidate(clone["_id"])
+            await bump_versions("asset_config")
+            return ResponseModel(content=clone, message=f"Cloned from Object ID {id} successfully.", status_code=status.HTTP_200_OK)
         else:
             return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message=f"Clone Object ID {id} doesn't exist.")
 
@@ -106,12 +135,19 @@ async def delete_config(id: str):
     if not ObjectId.is_valid(id):
         return ResponseModel(message=f"Object ID: {id} is not valid.", status_code=status.HTTP_400_BAD_REQUEST)
     else:
-        data = await mongo_client.asset_config.find_one({"_id": ObjectId(id)})
-        if data and len(data["cloned_stocks"]) == 0:
-            delete_result = await mongo_client.asset_config.delete_one({"_id": ObjectId(id)})
+        # Stocks are only ever added to `cloned_stocks`, a cached config that has some can't be deleted
+        data = await config_cache.get_config(id)
+        if not (data and data["has_cloned_stocks"]):
+            # Conditional on there being no cloned stocks, in case some were created since it was read
+            delete_result = await mongo_client.asset_config.delete_one({"_id": ObjectId(id), "cloned_stocks.0": {"$exists": False}})
             if (delete_result.deleted_count == 1):
+                config_cache.invalidate(id)
+                await bump_versions("asset_config")
                 return ResponseModel(content=delete_result.raw_result, message=f"Object ID: {id} deleted successfully.")
-        elif len(data["cloned_stocks"]) > 0:
+
+        # The cache only knows whether there are cloned stocks, not which
+        data = data and await mongo_client.asset_config.find_one({"_id": ObjectId(id)}, {"cloned_stocks": 1})
+        if data:
             return ResponseModel(
                 message=f"Please delete the cloned stock(s) before deleting this configuration.", 
                 status_code=status.HTTP_409_CONFLICT, content={ "cloned_stocks": data['cloned_stocks'] }
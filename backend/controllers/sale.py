@@ -1,10 +1,17 @@
 from fastapi import APIRouter, Body, status, Depends, Query
 from data.models.stock import Stock, StockStatusEnum
-from data.models.sale import Sale, SaleRequestObject
+from data.models.sale import Sale, SaleRequestObject, SaleAnalyticsGranularityEnum
 from data.models.user import User
-from utils.util import ResponseModel, get_class_attributes, parse_projections, parse_filters
+from utils.util import ResponseModel, parse_sort, paginate, stream_export, ExportFormatEnum, PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX
+from utils.filters import get_class_attributes, parse_projections, compile_filter, legacy_query
 from utils.security import UserUtil
 from data.db.client import mongo_client
+from data.db.sale_rollup import apply_rollup_changes, sales_analytics, ROLLUP_DIMENSIONS
+from data.db.collection_versions import bump_versions
+from utils.conditional import ConditionalGet
+from data.db.transactions import run_in_transaction, TransactionRetriesExhausted, TRANSACTION_RETRY_MESSAGE
+from data.db.stock_state import transition_stocks, TransitionConflict, TRANSITION_COLLECTIONS
+from pymongo import ReturnDocument, DESCENDING
 from typing import Any
 import datetime as dt
 from urllib.parse import unquote
@@ -14,27 +21,65 @@ sale_router = APIRouter(
     tags=["sale"]
 )
 
-@sale_router.get("/", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_atleast_admin)])
+# Fields that the listing can be sorted on, each of these must be backed by an index
+SORTABLE_FIELDS = ["_id", "serial", "sale_date", "price"]
+
+@sale_router.get("/", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_atleast_admin), Depends(ConditionalGet("sale", reporting=True))])
 async def get_all_sales(
         fields: str = Query("", description="Fields to display.<br>Format: `field1,field2,..`"), 
+        q: str = Query("", description=(
+            'Filter query, combined with the filters below.<br>Format: `price:40000..60000;sale_date:2023-10-10..;(customer_name:Ms* | mobile:+91*)`')),
         in_filters: str = Query("", description="Filter by field matches.<br>Format: `customer_name=Ms.ABC.Mr.XYZ,mobile=+91 98104181041`"),
         price_filter: str = Query("", description=(
             'Filter by price bounds (boundary included). Will take precedence over __in_filters__ if provided.' + 
             '<br>Format: Between 10000 and 20000 -> `10000,20000` (or) >= 100000 -> `100000`')),
         sale_dt_filter: str = Query("", description=(
             'Filter by sale date bounds (boundary included). Will take precedence over __in_filters__ if provided.' + 
-            '<br>Format: >= 2023-10-10 -> `2023-10-10,`'))
+            '<br>Format: >= 2023-10-10 -> `2023-10-10,`')),
+        sort: str = Query("_id", description=f"Sort order, prefix with `-` for descending.<br>Allowed: `{', '.join(SORTABLE_FIELDS)}`"),
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX, description="Maximum number of sales to return."),
+        after: str = Query("", description="Cursor returned as `next_cursor` by the previous page."),
+        export_format: ExportFormatEnum = Query(ExportFormatEnum.json, alias="format", description=(
+            'Response format. `ndjson` & `csv` stream every matching sale, `limit` is ignored for these.'))
     ):
     
-    '''List all the sales. Requires user logged in to atleast be an admin.'''
+    '''List all the sales, paginated using `next_cursor`. Requires user logged in to atleast be an admin.'''
     
     attrs = get_class_attributes(Sale)
-    filters = parse_filters(attrs, unquote(in_filters), price_filter, sale_dt_filter, price_field_name="price", dt_field_name="sale_date")
-    projection = parse_projections(fields, attrs)
+    projection = parse_projections(fields, Sale)
+    try:
+        legacy = legacy_query(unquote(in_filters), price_filter, sale_dt_filter, dt_field_name="sale_date")
+        filters = compile_filter(Sale, ";".join(filter(None, [q, legacy])))
+        if export_format != ExportFormatEnum.json:
+            return stream_export(
+                mongo_client.reporting.sale, filters, projection, parse_sort(sort, SORTABLE_FIELDS), after, export_format, attrs, "sales"
+            )
+        sales, next_cursor = await paginate(mongo_client.reporting.sale, filters, projection, parse_sort(sort, SORTABLE_FIELDS), limit, after)
+    except ValueError as e:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=str(e))
 
-    sales = [sale async for sale in mongo_client.sale.find(filters, projection)]
     if len(sales):
-        return ResponseModel(content=sales)
+        return ResponseModel(content=sales, next_cursor=next_cursor)
+    else:
+        return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message="No relevant results were found.")
+
+@sale_router.get("/analytics", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_owner), Depends(ConditionalGet("sale_rollup", reporting=True))])
+async def get_sales_analytics(
+        granularity: SaleAnalyticsGranularityEnum = Query(SaleAnalyticsGranularityEnum.day, description="Size of the time buckets."),
+        group_by: str = Query("", description=f"Additional dimensions to group by.<br>Format: `{','.join(ROLLUP_DIMENSIONS)}`"),
+        start: dt.datetime | None = Query(None, description="Sales on or after this date."),
+        end: dt.datetime | None = Query(None, description="Sales on or before this date.")
+    ):
+
+    '''Revenue, units sold & average price per time bucket, served from the sale rollups. Only owners have access to this API.'''
+
+    dimensions = [d for d in map(str.strip, group_by.split(",")) if d]
+    if any(d not in ROLLUP_DIMENSIONS for d in dimensions):
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Sales can only be grouped by: {', '.join(ROLLUP_DIMENSIONS)}.")
+
+    buckets = await sales_analytics(granularity, dimensions, start, end)
+    if len(buckets):
+        return ResponseModel(content=buckets)
     else:
         return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message="No relevant results were found.")
 
@@ -43,63 +88,64 @@ async def sell_stock(sales_request_obj: SaleRequestObject = Body(...), user: Use
     '''Sell a particular stock, provided the stock is in valid status.'''
 
     # Get all the serial numbers
-    stock_ids_for_sale: set[str] = {sale.serial for sale in sales_request_obj.sales}
+    stock_ids_for_sale: list[str] = [sale.serial for sale in sales_request_obj.sales]
+    if len(set(stock_ids_for_sale)) != len(stock_ids_for_sale):
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Please ensure that the serial# are unique.")
 
-    # Find the serial numbers from DB & ensure that all of them exists
-    stocks_for_sale: list[dict[str, Any]] = [stock async for stock in mongo_client.stock.find({"serial": {"$in": list(stock_ids_for_sale)}})]
+    # Flatten the object to Sales
+    sales: list[Sale] = [
+        Sale(
+            customer_name=sales_request_obj.customer_name,
+            mobile=sales_request_obj.mobile,
+            address=sales_request_obj.address,
+            remarks=sales_request_obj.remarks,
+            serial=sale.serial,
+            price=sale.price,
+            sale_date=sales_request_obj.sale_date,
+            create_date=user["AH_DATE"](),
+            created_by=user["AH_USER"],
+            update_date=None,
+            updated_by=None
+        ) for sale in sales_request_obj.sales
+    ]
 
-    if any(map(lambda x: x["current_status"] in ("sold", "deleted", "returned"), stocks_for_sale)):
-        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Some of stocks are not in a valid status for sale.")
+    async def sell(session) -> list[dict[str, Any]]:
+        # Update the status to sold, only stocks that are in a valid status for sale are matched
+        stocks_for_sale = await transition_stocks(stock_ids_for_sale, StockStatusEnum.sold, user, session=session)
 
-    elif (len(stocks_for_sale) != len(sales_request_obj.sales)):
-        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Only {len(stocks_for_sale)} stock(s) could be found out of the provided {len(sales_request_obj.sales)} stock(s).")
-    
-    else:
-        # Flatten the object to Sales
-        sales: list[Sale] = [
-            Sale(
-                customer_name=sales_request_obj.customer_name,
-                mobile=sales_request_obj.mobile,
-                address=sales_request_obj.address,
-                remarks=sales_request_obj.remarks,
-                serial=sale.serial,
-                price=sale.price,
-                sale_date=sales_request_obj.sale_date,
-                create_date=user["AH_DATE"](),
-                created_by=user["AH_USER"],
-                update_date=None,
-                updated_by=None
-            ) for sale in sales_request_obj.sales
-        ]
-
-        async with await mongo_client.client.start_session() as sesssion:
-                async with sesssion.start_transaction():
-
-                    # Update the status to sold
-                    stock_status_update_result = await mongo_client.stock.update_many(
-                        filter={"serial": {"$in": list(stock_ids_for_sale)}}, 
-                        update={"$set": {
-                            "current_status": StockStatusEnum.sold}, "updated_by": user["AH_USER"], "update_date": user["AH_DATE"](),
-                            "$push": {'status_history': {"status": StockStatusEnum.sold, "date": dt.datetime.utcnow()}}}, 
-                        upsert=False
-                    )
-
-                    sale_insert_result = await mongo_client.sale.insert_many(list(map(dict, sales)), ordered=False)
-
-                    if len(sale_insert_result.inserted_ids) == stock_status_update_result.modified_count == len(sales):
-                        inserted_sales: list[dict[str, Any]] = [
-                             sale async for sale in mongo_client.sale.find({"_id": {"$in": sale_insert_result.inserted_ids}})
-                        ]
-                        return ResponseModel(content=inserted_sales, message=f"{len(sales)} created successfully.")
-                    else:
-                        return ResponseModel(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, message=f"The sales couldn't be created. Please try again.")
+        # insert_many adds the generated `_id` to the documents, no need to read them back
+        inserted_sales: list[dict[str, Any]] = list(map(dict, sales))
+        await mongo_client.sale.insert_many(inserted_sales, ordered=False, session=session)
+
+        # Keep the sales analytics rollups in step
+        stocks_by_serial = {stock["serial"]: stock for stock in stocks_for_sale}
+        await apply_rollup_changes(
+            [(sale.sale_date, stocks_by_serial[sale.serial], sale.price, 1) for sale in sales], session=session
+        )
+        return inserted_sales
+
+    try:
+        inserted_sales = await run_in_transaction(sell)
+    except TransitionConflict as e:
+        return ResponseModel(
+            status_code=status.HTTP_409_CONFLICT, content=e.describe(),
+            message=f"Some of stocks either don't exist or are not in a valid status for sale."
+        )
+    except TransactionRetriesExhausted:
+        return ResponseModel(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, message=TRANSACTION_RETRY_MESSAGE)
+
+    await bump_versions(*TRANSITION_COLLECTIONS, "sale", "sale_rollup")
+    return ResponseModel(content=inserted_sales, message=f"{len(sales)} created successfully.")
         
 @sale_router.delete("/{serial}", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_owner)], deprecated=True)
 async def remove_sale(serial: str):
     '''Remove a sale entry. Only owners have access to his API's functionality.'''
-    data = await mongo_client.sale.delete_one({"serial": serial})
-    if (data.deleted_count == 1):
-        return ResponseModel(content=data.raw_result, message=f"Sale Object#: {serial} deleted successfully.")
+    data = await mongo_client.sale.find_one_and_delete({"serial": serial})
+    if data:
+        stock = await mongo_client.stock.find_one({"serial": serial}, {dimension: 1 for dimension in ROLLUP_DIMENSIONS})
+        await apply_rollup_changes([(data["sale_date"], stock or {}, data["price"], -1)])
+        await bump_versions("sale", "sale_rollup")
+        return ResponseModel(content=data, message=f"Sale Object#: {serial} deleted successfully.")
     else:
         return ResponseModel(message=f"Sale serial#: {serial} not found.", status_code=status.HTTP_404_NOT_FOUND)
         
@@ -108,47 +154,34 @@ async def swap_stock(sold_serial: str, exchange_with_serial: str, return_remarks
     '''
     Return a sold stock for a new one. Status of the sold stock would then be set to "returned".
     '''
-    sale: Sale = await mongo_client.sale.find_one({"serial": sold_serial})
-    sold: Stock = await mongo_client.stock.find_one({"serial": sold_serial})
-    exchange_with: Stock = await mongo_client.stock.find_one({"serial": exchange_with_serial})
-
-    # Ensure that both the provided serials exist
-    if (
-         sale and sold and sold["current_status"] == StockStatusEnum.sold and 
-         exchange_with and exchange_with["current_status"] in (StockStatusEnum.refurbished, StockStatusEnum.new)
-    ):
-        async with await mongo_client.client.start_session() as sesssion:
-            async with sesssion.start_transaction():
-                
-                update_sale_result = await mongo_client.sale.update_one({"serial": sold_serial}, {"$set": {
-                    "serial": exchange_with_serial, "updated_by": user["AH_USER"], "update_date": user["AH_DATE"](),
-                }})
-
-                update_sold_stock_result = await mongo_client.stock.update_one(
-                    filter={"serial": sold_serial}, 
-                    update={
-                        "$set": {
-                            "current_status": StockStatusEnum.returned, "remarks": sold["remarks"] + " | " + return_remarks, 
-                            "updated_by": user["AH_USER"], "update_date": user["AH_DATE"]()
-                        }, "$push": {'status_history': {"status": StockStatusEnum.returned, "date": dt.datetime.utcnow()}}
-                    }
-                )
-
-                update_exchange_with_stock_result = await mongo_client.stock.update_one(
-                    filter={"serial": exchange_with_serial}, 
-                    update={
-                        "$set": {
-                            "current_status": StockStatusEnum.sold, "updated_by": user["AH_USER"], "update_date": user["AH_DATE"]()
-                        }, "$push": {'status_history': {"status": StockStatusEnum.sold, "date": dt.datetime.utcnow()}}
-                    }
-                )
-                if update_sale_result and update_sold_stock_result and update_exchange_with_stock_result:
-                    sale = await mongo_client.sale.find_one({"serial": exchange_with_serial})
-                    return ResponseModel(content=dict(sale), message="Stock exchanged successfully.")
-                else:
-                    return ResponseModel(message="Stock exchanged was unsuccessful. Please try again.", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    else:
+    async def swap(session) -> dict[str, Any]:
+        # Latest sale of the stock being returned
+        sale = await mongo_client.sale.find_one_and_update({"serial": sold_serial}, {"$set": {
+            "serial": exchange_with_serial, "updated_by": user["AH_USER"], "update_date": user["AH_DATE"](),
+        }}, sort=[("sale_date", DESCENDING)], return_document=ReturnDocument.AFTER, session=session)
+        if not sale:
+            raise TransitionConflict({sold_serial: None})
+
+        sold, = await transition_stocks([sold_serial], StockStatusEnum.returned, user, {
+            "remarks": {"$concat": [{"$ifNull": ["$remarks", ""]}, {"$literal": " | " + return_remarks}]}
+        }, session=session)
+        exchange_with, = await transition_stocks([exchange_with_serial], StockStatusEnum.sold, user, session=session)
+
+        # The sale now counts towards the exchanged stock's brand & model
+        await apply_rollup_changes([
+            (sale["sale_date"], sold, sale["price"], -1), (sale["sale_date"], exchange_with, sale["price"], 1)
+        ], session=session)
+        return sale
+
+    try:
+        sale = await run_in_transaction(swap)
+    except TransitionConflict as e:
         return ResponseModel(
-            status_code=status.HTTP_400_BAD_REQUEST, 
+            status_code=status.HTTP_400_BAD_REQUEST, content=e.describe(),
             message=f"Please ensure that the serial# provided exist & are in a valid state - {sold_serial}, {exchange_with_serial}."
         )
+    except TransactionRetriesExhausted:
+        return ResponseModel(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, message=TRANSACTION_RETRY_MESSAGE)
+
+    await bump_versions(*TRANSITION_COLLECTIONS, "sale", "sale_rollup")
+    return ResponseModel(content=sale, message="Stock exchanged successfully.")
@@ -1,11 +1,28 @@
-from fastapi import APIRouter, Body, status, Depends, Query
-from data.models.stock import Stock, StockStatusEnum, UpdateStock
+from fastapi import APIRouter, Body, status, Depends, Query, Request, Header
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from data.models.stock import Stock, StockStatusEnum, UpdateStock, BulkStockUpdate
+from data.models.asset_config import AssetConfig
 from data.models.user import User, UserTypeEnum
-from utils.util import ResponseModel, get_class_attributes, parse_projections, parse_filters
+from utils.util import ResponseModel, parse_sort, paginate, stream_export, ExportFormatEnum, PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX
+from utils.util import iter_csv_records, dump_json, IMPORT_BATCH_SIZE, settings
+from utils.filters import get_class_attributes, parse_projections, compile_filter, legacy_query
+from utils.specs import normalize_specs
 from utils.security import JWTUtil, UserUtil
 from data.db.client import mongo_client
+from data.db.inventory_counters import apply_counter_changes, inventory_summary
+from data.db.stock_state import transition_stocks, transition_error, bulk_update_stocks, TransitionConflict, TRANSITION_COLLECTIONS
+from data.db.collection_versions import bump_versions
+from data.db.config_cache import config_cache
+from data.db.transactions import run_in_transaction, TransactionRetriesExhausted, TRANSACTION_RETRY_MESSAGE
+from utils.conditional import ConditionalGet
+from data.db.stock_events import record_events
+from data.db.stock_search import search_stocks, SEARCH_FACETS
+from data.db.stock_feed import stock_feed, RESUME_TOKEN
 from bson import ObjectId
-from typing import Any, Annotated
+from typing import Any, Annotated, AsyncIterator
+import asyncio
 import datetime as dt
 from urllib.parse import unquote
 
@@ -14,28 +31,171 @@ stock_router = APIRouter(
     tags=["stock"]
 )
 
-@stock_router.get(path="/", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated)])
+# Fields that the listing can be sorted on, each of these must be backed by an index
+SORTABLE_FIELDS = ["_id", "serial", "purchase_date", "price"]
+
+# Comment sent on idle event streams, keeps the proxies from closing them
+STOCK_FEED_HEARTBEAT_SECONDS = float(settings.get("STOCK_FEED_HEARTBEAT_SECONDS", 15))
+
+@stock_router.get(path="/", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated), Depends(ConditionalGet("stock", reporting=True))])
 async def get_all_stocks(
         fields: str = Query("", description="Fields to display.<br>Format: `field1,field2,..`"), 
+        q: str = Query("", description=(
+            'Filter query, combined with the filters below.<br>Format: `brand:Acer,Dell;price:40000..60000;RAM_gb:>=16;ssd_size_gb:>=512;!OS:Windows*`')),
         in_filters: str = Query("", description="Filter by field matches.<br>Format: `brand=Acer.Dell, OS=windows`"),
         price_filter: str = Query("", description=(
             'Filter by price bounds (boundary included). Will take precedence over __in_filters__ if provided.' + 
             '<br>Format: Between 10000 and 20000 -> `10000,20000` (or) >= 100000 -> `100000`')),
         purchase_dt_filter: str = Query("", description=(
             'Filter by purchase date bounds (boundary included). Will take precedence over __in_filters__ if provided.' + 
-            '<br>Format: >= 2023-10-10 -> `2023-10-10,`'))
+            '<br>Format: >= 2023-10-10 -> `2023-10-10,`')),
+        sort: str = Query("_id", description=f"Sort order, prefix with `-` for descending.<br>Allowed: `{', '.join(SORTABLE_FIELDS)}`"),
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX, description="Maximum number of stocks to return."),
+        after: str = Query("", description="Cursor returned as `next_cursor` by the previous page."),
+        export_format: ExportFormatEnum = Query(ExportFormatEnum.json, alias="format", description=(
+            'Response format. `ndjson` & `csv` stream every matching stock, `limit` is ignored for these.'))
     ):
     
-    '''Get all stocks. This API supports a variety of filters.'''
+    '''Get all stocks. This API supports a variety of filters and is paginated using `next_cursor`.'''
 
     attrs = get_class_attributes(Stock)
-    filters = parse_filters(attrs, unquote(in_filters), price_filter, purchase_dt_filter, price_field_name="price", dt_field_name="purchase_date")
-    projection = parse_projections(fields, attrs)
-    stocks: list[dict] = [stock async for stock in mongo_client.stock.find(
-        filters, projection
-    )]
+    projection = parse_projections(fields, Stock)
+    try:
+        legacy = legacy_query(unquote(in_filters), price_filter, purchase_dt_filter, dt_field_name="purchase_date")
+        filters = compile_filter(Stock, ";".join(filter(None, [q, legacy])))
+        if export_format != ExportFormatEnum.json:
+            return stream_export(
+                mongo_client.reporting.stock, filters, projection, parse_sort(sort, SORTABLE_FIELDS), after, export_format, attrs, "stocks"
+            )
+        stocks, next_cursor = await paginate(mongo_client.reporting.stock, filters, projection, parse_sort(sort, SORTABLE_FIELDS), limit, after)
+    except ValueError as e:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=str(e))
+
     if (len(stocks) > 0):
-        return ResponseModel(content=stocks)
+        return ResponseModel(content=stocks, next_cursor=next_cursor)
+    else:
+        return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message="No relevant results were found.")
+
+@stock_router.get(path="/summary", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated), Depends(ConditionalGet("inventory_counter", reporting=True))])
+async def get_stock_summary(config_id: str = Query("", description="Config ID to count the stocks of, counts across all configs when not provided.")):
+    '''Count of stocks per status, served from counters that are maintained on every status change.'''
+    summary = await inventory_summary(config_id)
+    if len(summary):
+        return ResponseModel(content=summary[0])
+    else:
+        return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message="No relevant results were found.")
+
+@stock_router.get(path="/search", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated), Depends(ConditionalGet("stock", reporting=True))])
+async def search_stocks_by_specs(
+        text: str = Query("", description="Words to search for in the `model` & `remarks` of the stocks."),
+        q: str = Query("", description="Filter query applied before the facets.<br>Format: `current_status:new,refurbished;price:..60000`"),
+        brand: str = Query("", description="Brand facet selection.<br>Format: `Acer,Dell`"),
+        processor_type: str = Query("", description="Processor facet selection.<br>Format: `Intel Core i5*`"),
+        RAM: str = Query("", description="RAM facet selection.<br>Format: `8 GB,16 GB`"),
+        ssd_size: str = Query("", description="SSD facet selection.<br>Format: `512 GB`"),
+        OS: str = Query("", description="OS facet selection.<br>Format: `Windows*`"),
+        fields: str = Query("", description="Fields to display.<br>Format: `field1,field2,..`"),
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX, description="Maximum number of stocks to return."),
+        offset: int = Query(0, ge=0, description="Number of matching stocks to skip.")
+    ):
+
+    '''
+    Search the stocks by their specifications. Returns the matching stocks (best text matches first) along
+    with the number of stocks per value of each facet, computed in a single aggregation.
+    '''
+
+    facet_values = {"brand": brand, "processor_type": processor_type, "RAM": RAM, "ssd_size": ssd_size, "OS": OS}
+    try:
+        filters = compile_filter(Stock, q)
+        selections = {facet: compile_filter(Stock, f"{facet}:{facet_values[facet]}") for facet in SEARCH_FACETS if facet_values[facet].strip()}
+    except ValueError as e:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=str(e))
+
+    result = await search_stocks(text.strip(), filters, selections, parse_projections(fields, Stock), limit, offset)
+    return ResponseModel(content=result)
+
+def _sse(event: str, data: Any, id: Any = None) -> str:
+    return (f"id: {id}\n" if id is not None else "") + f"event: {event}\ndata: {dump_json(data).decode()}\n\n"
+
+async def _event_stream(statuses: set[str], config_ids: set[str], last_event_id: str) -> AsyncIterator[str]:
+    '''Server sent events of a new subscriber, starting with the ones missed since `last_event_id` (when resuming).'''
+    # Subscribed once the response starts, so that it is always unsubscribed
+    subscriber = stock_feed.subscribe(statuses, config_ids)
+    try:
+        # Retry delay of the browser's `EventSource` when the stream ends
+        yield "retry: 1000\n\n"
+
+        replayed: set[str] = set()
+        if last_event_id:
+            events, truncated = await stock_feed.replay(subscriber, last_event_id)
+            if truncated:
+                yield _sse("reset", {"message": "The missed events can't be replayed, reload the stocks & subscribe again."})
+                return
+            for token, event in events:
+                replayed.add(token)
+                yield _sse("stock", event, token)
+
+        while True:
+            if subscriber.lagged.is_set() and subscriber.queue.empty():
+                # Reconnecting (with `Last-Event-ID`) resumes from the change stream
+                yield _sse("lagged", {"message": "Events were dropped as they weren't read in time, reconnect to resume."})
+                return
+            try:
+                token, event = await asyncio.wait_for(subscriber.queue.get(), STOCK_FEED_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if token not in replayed:
+                yield _sse("stock", event, token)
+    finally:
+        stock_feed.unsubscribe(subscriber)
+
+@stock_router.get(path="/events", dependencies=[Depends(UserUtil.is_authenticated)], response_class=StreamingResponse)
+async def stream_stock_events(
+        event_status: list[StockStatusEnum] = Query([], alias="status", description="Only stream the changes to these statuses."),
+        config_id: list[str] = Query([], description="Only stream the changes of the stocks of these configs."),
+        last_event_id: str = Header("", alias="Last-Event-ID", description="Resume after this event, set by `EventSource` on reconnects.")
+    ):
+    '''
+    Live feed of the stock status changes as server sent events (`text/event-stream`), instead of polling the listing.
+    Each `stock` event carries a `stock_events` document. Clients that fall behind get a `lagged` event and are
+    disconnected, reconnecting with the `Last-Event-ID` header replays what was missed.
+    '''
+    if last_event_id and not RESUME_TOKEN.fullmatch(last_event_id):
+        return ResponseModel(message=f"Last-Event-ID: {last_event_id} is not an id of this feed.", status_code=status.HTTP_400_BAD_REQUEST)
+    return StreamingResponse(
+        _event_stream({s.value for s in event_status}, set(config_id), last_event_id), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@stock_router.get(path="/history", response_model=ResponseModel, dependencies=[Depends(UserUtil.is_authenticated), Depends(ConditionalGet("stock_events", reporting=True))])
+async def get_stock_history(
+        serial: str = Query("", description="Serial# of the stock, events of all stocks are listed when not provided."),
+        event_status: StockStatusEnum | None = Query(None, alias="status", description="Only list the events for this status."),
+        start: dt.datetime | None = Query(None, description="Events on or after this date."),
+        end: dt.datetime | None = Query(None, description="Events on or before this date."),
+        sort: str = Query("date", description="Sort order, prefix with `-` for descending.<br>Allowed: `date`"),
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX, description="Maximum number of events to return."),
+        after: str = Query("", description="Cursor returned as `next_cursor` by the previous page.")
+    ):
+
+    '''Status changes of the stocks over a date range, paginated using `next_cursor`.'''
+
+    filters: dict[str, Any] = {}
+    if serial:
+        filters["serial"] = serial
+    if event_status:
+        filters["status"] = event_status
+    if start or end:
+        filters["date"] = {k: v for k, v in (("$gte", start), ("$lte", end)) if v}
+
+    try:
+        events, next_cursor = await paginate(mongo_client.reporting.stock_events, filters, {}, parse_sort(sort, ["date"]), limit, after)
+    except ValueError as e:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=str(e))
+
+    if len(events):
+        return ResponseModel(content=events, next_cursor=next_cursor)
     else:
         return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message="No relevant results were found.")
 
@@ -51,10 +211,7 @@ async def create_stocks(
         -> Scan the serial numbers, optionally edit the other values (iteratively or in one shot in the form of a table)
         -> Confirm and make a call to this API
     '''
-    if (ObjectId.is_valid(config_id)):
-        config = mongo_client.asset_config.find({"_id": ObjectId(config_id)})
-    else:
-        config = None
+    config = await config_cache.get_config(config_id)
     if config:
         stock_ids: set[str] = set()
         
@@ -62,6 +219,7 @@ async def create_stocks(
             # Add the audit fields
             stock.create_date = user["AH_DATE"]()
             stock.created_by = user["AH_USER"]
+            stock.config_id = config_id
             # Filter out just the serial to update the config document
             stock_ids.add(stock.serial)
 
@@ -69,25 +227,133 @@ async def create_stocks(
         if len(stock_ids) < len(stocks) or len(serial_num_exists_check) > 0:
             return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Please ensure that the serial# are unique.")
         else:
-            async with await mongo_client.client.start_session() as sesssion:
-                async with sesssion.start_transaction():
-
-                    config_update_result = await mongo_client.asset_config.update_one({"_id": ObjectId(config_id)}, {"$set": {
-                        "cloned_stocks": list(stock_ids), "update_date": user["AH_DATE"](), "updated_by": user["AH_USER"]
-                    }})
-
-                    stock_insert_result = await mongo_client.stock.insert_many(list(map(lambda x: x.dict(), stocks)), ordered=False)
-
-                    if config_update_result and stock_insert_result:
-                        inserted_stocks: list[dict[str, Any]] = []
-                        async for inserted_stock in mongo_client.stock.find({"_id": {"$in": stock_insert_result.inserted_ids}}):
-                            inserted_stocks.append(inserted_stock)
-                        return ResponseModel(content=inserted_stocks, message=f"Count: {len(stocks)} stocks created successfully.")
-                    else:
-                        return ResponseModel(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, message=f"The stocks couldn't be created. Please try again.")
+            async def create(session) -> list[dict[str, Any]] | None:
+                config_update_result = await mongo_client.asset_config.update_one({"_id": ObjectId(config_id)}, {
+                    "$addToSet": {"cloned_stocks": {"$each": list(stock_ids)}},
+                    "$set": {"update_date": user["AH_DATE"](), "updated_by": user["AH_USER"]}
+                }, session=session)
+                if config_update_result.matched_count == 0:
+                    # Deleted since it was cached, nothing was written
+                    return None
+
+                # insert_many adds the generated `_id` to the documents, no need to read them back
+                inserted_stocks: list[dict[str, Any]] = [normalize_specs(stock.dict()) for stock in stocks]
+                await mongo_client.stock.insert_many(inserted_stocks, ordered=False, session=session)
+                await record_events(inserted_stocks, user, session=session)
+                await apply_counter_changes([(config_id, None, stock.current_status) for stock in stocks], session=session)
+                return inserted_stocks
+
+            try:
+                inserted_stocks = await run_in_transaction(create)
+            except TransactionRetriesExhausted:
+                return ResponseModel(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, message=TRANSACTION_RETRY_MESSAGE)
+            if inserted_stocks is None:
+                return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Config ID# {config_id} is either invalid or doesn't exist.")
+
+            config_cache.invalidate(config_id)
+            await bump_versions("asset_config", *TRANSITION_COLLECTIONS)
+            return ResponseModel(content=inserted_stocks, message=f"Count: {len(stocks)} stocks created successfully.")
     else:
         return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Config ID# {config_id} is either invalid or doesn't exist.")
 
+async def _insert_stock_batch(user: User, config_id: str, batch: list[tuple[int, Stock]]) -> list[dict[str, Any]]:
+    '''
+    Insert a batch of imported stocks in a transaction, along with their events, the counters & the config's
+    `cloned_stocks`. Serials that already exist (or are repeated) are reported as failed, the others are inserted.
+    '''
+    async def insert(session) -> dict[int, str]:
+        # A write error would abort the whole transaction, the existing serials are left out instead
+        existing = {
+            stock["serial"] async for stock in mongo_client.stock.find(
+                {"serial": {"$in": [stock.serial for _, stock in batch]}}, {"serial": 1}, session=session
+            )
+        }
+        errors: dict[int, str] = {}
+        seen: set[str] = set()
+        for i, (_, stock) in enumerate(batch):
+            if stock.serial in existing:
+                errors[i] = "Serial# already exists."
+            elif stock.serial in seen:
+                errors[i] = "Serial# is repeated in the upload."
+            seen.add(stock.serial)
+
+        inserted = [stock for i, (_, stock) in enumerate(batch) if i not in errors]
+        if inserted:
+            await mongo_client.stock.insert_many([normalize_specs(stock.dict()) for stock in inserted], ordered=False, session=session)
+            await mongo_client.asset_config.update_one({"_id": ObjectId(config_id)}, {
+                "$addToSet": {"cloned_stocks": {"$each": [stock.serial for stock in inserted]}},
+                "$set": {"update_date": user["AH_DATE"](), "updated_by": user["AH_USER"]}
+            }, session=session)
+            await record_events([stock.dict() for stock in inserted], user, session=session)
+            await apply_counter_changes([(config_id, None, stock.current_status) for stock in inserted], session=session)
+        return errors
+
+    try:
+        errors = await run_in_transaction(insert)
+    except TransactionRetriesExhausted:
+        errors = {i: TRANSACTION_RETRY_MESSAGE for i in range(len(batch))}
+    except BulkWriteError as e:
+        # Nothing of the batch was written
+        errors = {i: e.details["writeErrors"][0]["errmsg"] for i in range(len(batch))}
+
+    if len(errors) < len(batch):
+        config_cache.invalidate(config_id)
+        await bump_versions("asset_config", *TRANSITION_COLLECTIONS)
+
+    return [
+        {"row": row, "serial": stock.serial, "status": "failed", "error": errors[i]} if i in errors else 
+        {"row": row, "serial": stock.serial, "status": "created"}
+        for i, (row, stock) in enumerate(batch)
+    ]
+
+@stock_router.post(
+    path="/{config_id}/import", response_model=ResponseModel, 
+    openapi_extra={"requestBody": {"required": True, "content": {"text/csv": {"schema": {"type": "string"}}}}}
+)
+async def import_stocks(
+    user: Annotated[User, Depends(UserUtil.is_authenticated)], config_id: str, request: Request,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000, description="Number of stocks validated & inserted together.")
+):
+    '''
+    Create stocks from a CSV upload (`Content-Type: text/csv`). The header row names the stock fields, 
+    fields that are left out (or empty) are taken from the config. The upload is parsed as it is received 
+    and inserted in batches, the response reports the outcome of every row.
+    '''
+    config_fields = [f for f in get_class_attributes(AssetConfig) if f in get_class_attributes(Stock)]
+    config = await mongo_client.asset_config.find_one({"_id": ObjectId(config_id)}, {f: 1 for f in config_fields}) if ObjectId.is_valid(config_id) else None
+    if not config:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Config ID# {config_id} is either invalid or doesn't exist.")
+    config.pop("_id")
+
+    report: list[dict[str, Any]] = []
+    batch: list[tuple[int, Stock]] = []
+    async for row, record in iter_csv_records(request.stream()):
+        try:
+            stock = Stock(**{**config, **{k: v for k, v in record.items() if v}})
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            report.append({"row": row, "serial": record.get("serial"), "status": "failed", "error": error})
+            continue
+
+        # Add the audit fields
+        stock.create_date = user["AH_DATE"]()
+        stock.created_by = user["AH_USER"]
+        stock.config_id = config_id
+        batch.append((row, stock))
+
+        if len(batch) >= batch_size:
+            report.extend(await _insert_stock_batch(user, config_id, batch))
+            batch = []
+    if batch:
+        report.extend(await _insert_stock_batch(user, config_id, batch))
+
+    created = sum(1 for r in report if r["status"] == "created")
+    return ResponseModel(
+        content={"created": created, "failed": len(report) - created, "rows": report}, 
+        message=f"Count: {created} of {len(report)} stocks imported successfully.",
+        status_code=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+    )
+
 @stock_router.delete(path="/{serial}", response_model=ResponseModel)
 async def delete_stock(user: Annotated[User, Depends(JWTUtil.get_current_user)], serial: str, soft: bool = True):
         '''
@@ -97,40 +363,97 @@ async def delete_stock(user: Annotated[User, Depends(JWTUtil.get_current_user)],
         Hard delete -> removes it from the DB
         '''
         if (user["type"] == UserTypeEnum.admin and soft == True) or (user["type"] == UserTypeEnum.owner):
-            if soft == False:
-                data = await mongo_client.stock.delete_one({"serial": serial})
-            else:
-                current = await mongo_client.stock.find_one({"serial": serial})
-                if current["current_status"] != StockStatusEnum.deleted:
-                    data = await mongo_client.stock.update_one({"serial": serial}, {"$set": {
-                        "current_status": StockStatusEnum.deleted}, "update_date": user["AH_DATE"](), "updated_by": user["AH_USER"],
-                        "$push": {'status_history': {"status": StockStatusEnum.deleted, "date": dt.datetime.utcnow()}}
-                    })
-                else:
+            async def delete(session) -> dict[str, Any] | None:
+                if soft == False:
+                    current = await mongo_client.stock.find_one_and_delete({"serial": serial}, session=session)
+                    if current:
+                        await record_events([current], user, StockStatusEnum.deleted, session=session)
+                        await apply_counter_changes([(current.get("config_id"), current["current_status"], None)], session=session)
+                    return current
+                current, = await transition_stocks([serial], StockStatusEnum.deleted, user, session=session)
+                return current
+
+            try:
+                current = await run_in_transaction(delete)
+            except TransactionRetriesExhausted:
+                return ResponseModel(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, message=TRANSACTION_RETRY_MESSAGE)
+            except TransitionConflict as e:
+                if e.conflicts[serial] == StockStatusEnum.deleted:
                     return ResponseModel(message=f"Serial Number: {serial} is already disabled.", status_code=status.HTTP_409_CONFLICT)
-            if ((soft == False and data.deleted_count == 1) or (soft == True and data.modified_count == 1)):
-                return ResponseModel(content=data.raw_result, message=f"Serial Number: {serial} {'disabled' if soft else 'deleted'} successfully.")
+                current = None
+            if current:
+                await bump_versions(*TRANSITION_COLLECTIONS)
+                return ResponseModel(content=current, message=f"Serial Number: {serial} {'disabled' if soft else 'deleted'} successfully.")
             else:
                 return ResponseModel(message=f"Serial Number: {serial} not found.", status_code=status.HTTP_404_NOT_FOUND)
         else:
             return ResponseModel(message="Insufficient privileges for this operation.")
         
+@stock_router.patch("/bulk", response_model=ResponseModel)
+async def bulk_update_stock(
+    user: Annotated[User, Depends(UserUtil.is_atleast_admin)], 
+    items: list[BulkStockUpdate] = Body(..., description=f"Updates by serial#, upto {PAGE_LIMIT_MAX} per request.")
+):
+    '''
+    Update many stocks at once (ex: refurbishing a pallet of returned stocks), requires that the user be atleast an Admin.
+    Status changes must be allowed transitions. The outcome is reported per serial#, the other stocks are still updated
+    when some of them fail.
+    '''
+    if not items or len(items) > PAGE_LIMIT_MAX:
+        return ResponseModel(status_code=status.HTTP_400_BAD_REQUEST, message=f"Between 1 and {PAGE_LIMIT_MAX} updates can be made per request.")
+
+    try:
+        results = await bulk_update_stocks(items, user)
+    except TransactionRetriesExhausted:
+        return ResponseModel(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, message=TRANSACTION_RETRY_MESSAGE)
+    updated = sum(1 for r in results if r["status"] == "updated")
+    return ResponseModel(
+        content={"updated": updated, "failed": len(results) - updated, "stocks": results},
+        message=f"Count: {updated} of {len(results)} stocks updated successfully.",
+        status_code=status.HTTP_200_OK if updated else status.HTTP_400_BAD_REQUEST
+    )
+
 @stock_router.patch("/{serial}", response_model=ResponseModel)
 async def update_stock(user: Annotated[User, Depends(UserUtil.is_atleast_admin)], serial: str, update: UpdateStock = Body(...)):
-    '''Update a stock, requires that the user be atleast an Admin.'''
-    stock_current: dict = await mongo_client.stock.find_one({"serial": serial})
+    '''
+    Update a stock, requires that the user be atleast an Admin. Status changes follow the same transitions
+    as the sales & bulk updates, the stock, its event & the counters are written in one transaction.
+    '''
     stock_to_update = {k: v for k, v in update.dict().items() if (v is not None and k not in ('created_by', 'create_date'))}
-    if stock_current:
+
+    async def apply(session) -> tuple[dict[str, Any] | None, str | None]:
+        stock_current: dict = await mongo_client.stock.find_one({"serial": serial}, session=session)
+        if not stock_current:
+            return None, None
+        current_status = stock_current["current_status"]
+        error = transition_error(current_status, stock_to_update.get("current_status"))
+        if error:
+            return stock_current, error
+
         stock_current.update(stock_to_update)
+        normalize_specs(stock_current)
+        if stock_current["current_status"] != current_status:
+            stock_current["status_date"] = user["AH_DATE"]()
 
         # Add the audit fields
         stock_current["update_date"] = user["AH_DATE"]()
         stock_current["updated_by"] = user["AH_USER"]
 
-        update_result = await mongo_client.stock.update_one({"serial": serial}, {"$set": stock_current})
-        if update_result:
-            return ResponseModel(content=stock_current, message=f"Update on Serial# {serial} was successful.")
-        else:
-            return ResponseModel(message=f"Update on Serial# {serial} failed.", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        await mongo_client.stock.update_one({"_id": stock_current["_id"]}, {"$set": stock_current}, session=session)
+        if stock_current["current_status"] != current_status:
+            await record_events([stock_current], user, date=stock_current["status_date"], session=session)
+            await apply_counter_changes([(stock_current.get("config_id"), current_status, stock_current["current_status"])], session=session)
+        return stock_current, None
+
+    try:
+        stock_current, error = await run_in_transaction(apply)
+    except TransactionRetriesExhausted:
+        return ResponseModel(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, message=TRANSACTION_RETRY_MESSAGE)
+
+    if not stock_current:
+        return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message=f"Serial# {serial} doesn't exist.")
+    elif error:
+        return ResponseModel(message=f"Serial# {serial}: {error}", status_code=status.HTTP_409_CONFLICT)
     else:
-        return ResponseModel(status_code=status.HTTP_404_NOT_FOUND, message=f"Serial# {serial} doesn't exist.")
\ No newline at end of file
+        await bump_versions(*TRANSITION_COLLECTIONS)
+        return ResponseModel(content=stock_current, message=f"Update on Serial# {serial} was successful.")
@@ -1,21 +1,24 @@
 from fastapi import APIRouter, Body, status, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo import ReturnDocument
 from data.db.client import mongo_client
 from utils.util import ResponseModel
 from data.models.user import User, UserTypeEnum, UpdateUser
 import datetime as dt
 from typing import Annotated
 from utils.security import HashUtil, JWTUtil, UserUtil
+from data.db.collection_versions import bump_versions
+from utils.conditional import ConditionalGet
 
 user_router = APIRouter(
     prefix="/user",
     tags=["user"]
 )
 
-@user_router.get("/", deprecated=True, response_model=ResponseModel, dependencies=[Depends(UserUtil.is_atleast_admin)])
+@user_router.get("/", deprecated=True, response_model=ResponseModel, dependencies=[Depends(UserUtil.is_atleast_admin), Depends(ConditionalGet("user", reporting=True))])
 async def get_all_users():
     '''Lists all the users. This API might be of use to Admins and Owners, otherwise it's usage discouraged.'''
-    users = [user async for user in mongo_client.user.find({}, { "password": 0 })]
+    users = [user async for user in mongo_client.reporting.user.find({}, { "password": 0 })]
     return ResponseModel(content=users)
 
 @user_router.post("/create", response_model=ResponseModel)
@@ -32,9 +35,12 @@ async def create_user(logged_in_user: Annotated[User, Depends(JWTUtil.get_curren
             user.create_date = logged_in_user["AH_DATE"]()
             user.created_by = logged_in_user["AH_USER"]
 
-            user.password = HashUtil.get_password_hash(user.password)
-            inserted = await mongo_client.user.insert_one(user.dict())
-            new_user = await mongo_client.user.find_one({ "_id": inserted.inserted_id }, { "password": 0 } )
+            user.password = await HashUtil.get_password_hash_async(user.password)
+            new_user = user.dict()
+            await mongo_client.user.insert_one(new_user)
+            await bump_versions("user")
+            new_user.pop("password")
+            JWTUtil.principal_cache.invalidate(user.username)
             return ResponseModel(
                 content=new_user, 
                 message="User has been successfully added",
@@ -48,7 +54,7 @@ async def create_user(logged_in_user: Annotated[User, Depends(JWTUtil.get_curren
 @user_router.post("/login", response_model=JWTUtil.TokenModel)
 async def login_user_for_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     user_in_db = await mongo_client.user.find_one({"username": form_data.username})
-    pwd_match = HashUtil.verify_password(form_data.password, user_in_db["password"]) if (user_in_db) else False
+    pwd_match = await HashUtil.verify_password_async(form_data.password, user_in_db["password"]) if (user_in_db) else False
     if (user_in_db and not user_in_db["disabled"] and pwd_match):
         token = JWTUtil.generate_access_token({"sub": user_in_db["username"]})
         return {"access_token": token, "token_type": "bearer"}
@@ -84,17 +90,21 @@ async def update_user(logged_in_user: Annotated[User, Depends(JWTUtil.get_curren
             (logged_in_user["type"] == UserTypeEnum.owner and user_to_update["type"] != UserTypeEnum.owner) 
         ):
             if update_user.deleted:
-                update_result = await mongo_client.user.delete_one({"username": username})
+                update_result = await mongo_client.user.find_one_and_delete({"username": username}, {"password": 0})
             else: 
-                update_result = await mongo_client.user.update_one({"username": username}, {"$set": {
+                update_result = await mongo_client.user.find_one_and_update({"username": username}, {"$set": {
                     "disabled": bool(update_user.disabled), 
                     "updated_by": logged_in_user["AH_USER"], 
                     "update_date": logged_in_user["AH_DATE"](), 
-                    "password": HashUtil.get_password_hash(update_user.password) if update_user.password else user_to_update["password"]
-                }})
+                    "password": await HashUtil.get_password_hash_async(update_user.password) if update_user.password else user_to_update["password"]
+                }}, {"password": 0}, return_document=ReturnDocument.AFTER)
+
+            # Disabling / deleting an user must take effect from the very next request
+            JWTUtil.principal_cache.invalidate(username)
+            await bump_versions("user")
             if update_result:
                 return ResponseModel(
-                    content=await mongo_client.user.find_one({"username": username}), 
+                    content=update_result, 
                     message=f"User: {username} {'updated' if not update_user.deleted else 'deleted'} successfully."
                 )
         else:
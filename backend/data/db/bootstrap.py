@@ -0,0 +1,74 @@
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from data.db.client import mongo_client
+from utils.util import settings
+import asyncio
+import datetime as dt
+import os
+import socket
+
+BOOTSTRAP_LEASE_SECONDS = int(settings.get("BOOTSTRAP_LEASE_SECONDS", 60))
+BOOTSTRAP_WAIT_SECONDS = int(settings.get("BOOTSTRAP_WAIT_SECONDS", 300))
+
+# Shared by the workers of a single launch (set by `serve.py`), every other process bootstraps on its own
+BOOTSTRAP_ID = os.environ.get("BOOTSTRAP_ID") or str(uuid4())
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+async def _acquire(name: str) -> bool:
+    '''Take the lease on `name`, when it is free or expired. The unique `_id` makes sure only one process gets it.'''
+    now = dt.datetime.utcnow()
+    try:
+        lease = await mongo_client.bootstrap.find_one_and_update(
+            {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"owner": _owner()}]},
+            {"$set": {"owner": _owner(), "expires_at": now + dt.timedelta(seconds=BOOTSTRAP_LEASE_SECONDS), "acquired_at": now}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return lease is not None
+    except DuplicateKeyError:
+        # Held by another process, the upsert collided with the existing document
+        return False
+
+async def _renew(name: str):
+    '''Keep extending the lease while the bootstrap runs, so a slow index build doesn't let another process in.'''
+    while True:
+        await asyncio.sleep(BOOTSTRAP_LEASE_SECONDS / 3)
+        await mongo_client.bootstrap.update_one(
+            {"_id": name, "owner": _owner()},
+            {"$set": {"expires_at": dt.datetime.utcnow() + dt.timedelta(seconds=BOOTSTRAP_LEASE_SECONDS)}}
+        )
+
+async def run_once(name: str, bootstrap: Callable[[], Awaitable[Any]]) -> bool:
+    '''
+    Run the one time bootstrap work (indexes, seeding ..) in exactly one process per launch, under a lease
+    kept in the `bootstrap` collection. The other processes wait until it completes (or until
+    `BOOTSTRAP_WAIT_SECONDS`), a lease left behind by a crashed process expires after `BOOTSTRAP_LEASE_SECONDS`.
+    Returns whether the bootstrap ran in this process.
+    '''
+    deadline = asyncio.get_running_loop().time() + BOOTSTRAP_WAIT_SECONDS
+    while True:
+        lease = await mongo_client.bootstrap.find_one({"_id": name})
+        if lease and lease.get("completed_for") == BOOTSTRAP_ID:
+            return False
+
+        if await _acquire(name):
+            renewal = asyncio.create_task(_renew(name))
+            completed: dict[str, Any] = {}
+            try:
+                await bootstrap()
+                completed = {"completed_at": dt.datetime.utcnow(), "completed_for": BOOTSTRAP_ID}
+            finally:
+                # Released either way, on failures the next process to get the lease retries the bootstrap
+                renewal.cancel()
+                await mongo_client.bootstrap.update_one(
+                    {"_id": name, "owner": _owner()}, {"$set": {"expires_at": dt.datetime.utcnow(), **completed}}
+                )
+            return True
+
+        if asyncio.get_running_loop().time() > deadline:
+            print (f"Gave up waiting on the `{name}` bootstrap held by {lease.get('owner') if lease else 'another process'}.")
+            return False
+        await asyncio.sleep(0.5)
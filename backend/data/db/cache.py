@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+from data.db.change_streams import watch_collection
+import asyncio
+import time
+
+class LRUCache:
+    '''
+    In-process LRU cache of documents read from mongo, bounded to `max_size` entries. Kept coherent across
+    the workers by a change stream (see `watch`), entries only expire after `ttl` seconds while the stream
+    is down. Writes must call `invalidate` too, for the worker that made them.
+
+    Readers take `generation` before reading from mongo & pass it to `put`: values read before an
+    invalidation are dropped, they might already be stale.
+    '''
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.live = False
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._watcher: asyncio.Task | None = None
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry and (self.live or entry[0] + self.ttl > time.monotonic()):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        elif entry:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        if generation != self.generation or self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable | None = None):
+        '''Drop the entry, every entry when no key is given.'''
+        self.generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        '''Drop the entries whose key matches.'''
+        self.generation += 1
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def _set_live(self, live: bool):
+        # Changes made while the stream was down were missed, either way
+        self.live = live
+        self.invalidate()
+
+    def watch(self, collection, pipeline: list[dict[str, Any]], on_change: Callable[[dict[str, Any]], None], name: str):
+        '''Start watching the collection, once per worker after the connection is established.'''
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(watch_collection(collection, pipeline, on_change, self._set_live, name))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        self.live = False
+        self.invalidate()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries), "max_size": self.max_size, "ttl_seconds": self.ttl, "change_stream": self.live,
+            "hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,33 @@
+from typing import Any, Callable
+from pymongo.errors import PyMongoError
+import asyncio
+
+# Delay before the change stream is opened again, after it failed or couldn't be opened
+WATCH_RETRY_SECONDS = 30
+
+async def watch_collection(
+        collection, pipeline: list[dict[str, Any]], on_change: Callable[[dict[str, Any]], None],
+        on_live: Callable[[bool], None], name: str
+    ):
+    '''
+    Tail a change stream on the collection for as long as the task runs, reopening it after failures.
+    `on_live` is told when the stream is opened (changes made meanwhile were missed) and when it is lost,
+    including when change streams aren't available at all (ex: standalone mongo).
+    '''
+    live = False
+    while True:
+        try:
+            async with collection.watch(pipeline) as stream:
+                live = True
+                on_live(True)
+                async for change in stream:
+                    on_change(change)
+            # The stream was invalidated (collection dropped / renamed), watch it again
+            live = False
+            on_live(False)
+        except PyMongoError as e:
+            if live:
+                print (f"The {name} change stream failed, retrying in {WATCH_RETRY_SECONDS}s: {e}")
+            live = False
+            on_live(False)
+            await asyncio.sleep(WATCH_RETRY_SECONDS)
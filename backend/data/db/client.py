@@ -1,24 +1,108 @@
+from types import SimpleNamespace
+from typing import Any
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from utils.util import settings
+from utils.metrics import mongo_listeners
+from data.db.slow_queries import slow_query_recorder
+import asyncio
+import os
+
+COLLECTIONS = ["asset_config", "stock", "stock_events", "user", "sale", "sale_rollup", "inventory_counter", "bootstrap", "collection_versions"]
+
+READ_PREFERENCES = {
+    "primary": Primary, "primaryPreferred": PrimaryPreferred, "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred, "nearest": Nearest
+}
+
+# Setting -> (client option, type). Options that aren't set are left to the driver (or the connection string)
+CLIENT_SETTINGS: dict[str, tuple[str, Any]] = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_ZLIB_COMPRESSION_LEVEL": ("zlibCompressionLevel", int),
+}
+
+def build_connection_string() -> str:
+    if settings.get("MONGO_URI"):
+        return settings["MONGO_URI"]
+
+    USERNAME = settings['MONGO_INITDB_ROOT_USERNAME']
+    PASSWORD = settings['MONGO_INITDB_ROOT_PASSWORD']
+    DB_NAME = settings['MONGO_DB_NAME']
+    URL = settings['MONGO_URL']
+    REPLICA_SET = settings.get('MONGO_REPLICA_SET', "rs0")
+
+    return f"mongodb://{USERNAME}:{PASSWORD}@{URL}/{DB_NAME}?authSource=admin&retryWrites=true&w=majority" + \
+        (f"&replicaSet={REPLICA_SET}" if REPLICA_SET else "")
+
+def client_options() -> dict[str, Any]:
+    '''Pool, timeout & compression options of the mongo client, from the settings.'''
+    return {option: kind(settings[key]) for key, (option, kind) in CLIENT_SETTINGS.items() if settings.get(key)}
+
+def read_preference(name: str, max_staleness_seconds: int = -1):
+    '''
+    Build the read preference from its name. `max_staleness_seconds` bounds how far behind the primary
+    a secondary can be to serve reads (-1 for no bound), mongo requires it to be atleast 90 seconds.
+    '''
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Read preference `{name}` is not supported. Choose one of: {', '.join(READ_PREFERENCES)}.")
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness_seconds)
 
 class client:
     def __init__(self):
         self.client = AsyncIOMotorClient
+        self.pid: int | None = None
+
+        # Sockets & executor threads of a client don't survive a fork, a forked worker must connect on its own
+        os.register_at_fork(after_in_child=self._forget_parent_client)
+
+    def _forget_parent_client(self):
+        if self.pid is not None and self.pid != os.getpid():
+            self.client, self.pid = AsyncIOMotorClient, None
+
+    def _bind_collections(self, target, db):
+        for name in COLLECTIONS:
+            setattr(target, name, db.get_collection(name))
 
     async def establish_connection(self, url: str):
-        # Mongo drive client
-        self.client = AsyncIOMotorClient(url)
-        
+        if self.pid == os.getpid():
+            raise RuntimeError("The mongo client is already connected in this process.")
+
+        # Mongo drive client, one per process. Always reads from the primary, transactions can't read from anywhere else
+        self.client = AsyncIOMotorClient(
+            url, event_listeners=[*mongo_listeners(), slow_query_recorder], read_preference=Primary(), **client_options()
+        )
+        slow_query_recorder.attach(self.client, asyncio.get_running_loop())
+        self.pid = os.getpid()
+
         # Database name
-        self.db = self.client.inventory
+        self.db = self.client.get_database(settings.get("MONGO_DATABASE", "inventory"))
 
         # Collection names
-        self.asset_config = self.db.get_collection("asset_config")
-        self.stock = self.db.get_collection("stock")
-        self.user = self.db.get_collection("user")
-        self.sale = self.db.get_collection("sale")
+        self._bind_collections(self, self.db)
+
+        # Same collections for the read only (reporting) routes, these can be served by the secondaries.
+        # Reads here may lag behind the writes, anything that reads its own writes must use the collections above.
+        self.reporting = SimpleNamespace()
+        self._bind_collections(self.reporting, self.client.get_database(
+            self.db.name, read_preference=read_preference(
+                settings.get("MONGO_REPORTING_READ_PREFERENCE", "primary"),
+                int(settings.get("MONGO_REPORTING_MAX_STALENESS_SECONDS", -1))
+            )
+        ))
 
-    async def close_connection(self): 
+    async def close_connection(self):
         self.client.close()
+        self.pid = None
 
 # The mongo client instance that we would use from other classes
-mongo_client = client()
\ No newline at end of file
+mongo_client = client()
@@ -0,0 +1,38 @@
+from typing import Any
+from pymongo import UpdateOne
+from data.db.client import mongo_client
+from utils.util import settings
+import datetime as dt
+import time
+
+# How long a worker trusts the versions it read, changes made through other workers show up after this. Off by
+# default: a client whose GET lands on another worker than its write would otherwise get a 304 for stale data
+COLLECTION_VERSION_CACHE_SECONDS = float(settings.get("COLLECTION_VERSION_CACHE_MS", 0)) / 1000
+
+# Collection -> (read at, version, last modified)
+_cache: dict[str, tuple[float, int, dt.datetime]] = {}
+
+async def bump_versions(*collections: str):
+    '''
+    Record that the collections changed, called by every write path. Transactions bump the versions once they
+    commit, a bump inside them would make every concurrent writer conflict on the version documents. The
+    worker's own cached versions are dropped right away.
+    '''
+    now = dt.datetime.utcnow().replace(microsecond=0)
+    await mongo_client.collection_versions.bulk_write([
+        UpdateOne({"_id": name}, {"$inc": {"version": 1}, "$set": {"last_modified": now}}, upsert=True)
+        for name in set(collections)
+    ], ordered=False)
+    for name in collections:
+        _cache.pop(name, None)
+
+async def current_versions(*collections: str) -> dict[str, tuple[int, dt.datetime]]:
+    '''Version & last modified date of the collections, served from the worker's cache when fresh enough.'''
+    now = time.monotonic()
+    stale = [name for name in collections if name not in _cache or now - _cache[name][0] > COLLECTION_VERSION_CACHE_SECONDS]
+    if stale:
+        found: dict[str, Any] = {d["_id"]: d async for d in mongo_client.collection_versions.find({"_id": {"$in": stale}})}
+        for name in stale:
+            document = found.get(name, {})
+            _cache[name] = (now, document.get("version", 0), document.get("last_modified", dt.datetime(1970, 1, 1)))
+    return {name: _cache[name][1:] for name in collections}
@@ -0,0 +1,58 @@
+from typing import Any, Awaitable, Callable, Hashable
+from bson import ObjectId
+from data.db.client import mongo_client
+from data.db.cache import LRUCache
+from utils.util import settings
+
+# Fields of the cached configs, the `cloned_stocks` array grows without bounds & is only checked for being empty
+CONFIG_PROJECTION = {"_id": 1, "has_cloned_stocks": {"$gt": [{"$size": {"$ifNull": ["$cloned_stocks", []]}}, 0]}}
+
+class ConfigCache(LRUCache):
+    '''
+    Read-through cache of the `asset_config` documents (by id) & of the listing pages. A change to a config
+    drops it along with every cached listing.
+    '''
+
+    async def get_config(self, id: str) -> dict[str, Any] | None:
+        '''
+        The `_id` & `has_cloned_stocks` of the config with this id, None when the id is invalid or doesn't exist.
+        Callers get their own copy.
+        '''
+        if not ObjectId.is_valid(id):
+            return None
+        config = self.get(("id", id))
+        if config is None:
+            generation = self.generation
+            config = await mongo_client.asset_config.find_one({"_id": ObjectId(id)}, CONFIG_PROJECTION)
+            if config:
+                self.put(("id", id), config, generation)
+        return dict(config) if config else None
+
+    async def list_configs(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        '''A listing page, `key` identifies the query that `load` runs. Pages are shared, callers must not modify them.'''
+        page = self.get(("list", key))
+        if page is None:
+            generation = self.generation
+            page = await load()
+            self.put(("list", key), page, generation)
+        return page
+
+    def invalidate(self, id: Any = None):
+        '''Drop the config (every config, when no id is given) along with the listings.'''
+        if id is None:
+            super().invalidate()
+            return
+        super().invalidate(("id", str(id)))
+        self.invalidate_where(lambda key: key[0] == "list")
+
+    def start(self):
+        # Only the ids are needed, updates to `cloned_stocks` would otherwise send the whole array
+        self.watch(
+            mongo_client.asset_config, [{"$project": {"operationType": 1, "documentKey": 1}}],
+            lambda change: self.invalidate(change.get("documentKey", {}).get("_id")), "config cache"
+        )
+
+config_cache = ConfigCache(
+    max_size=int(settings.get("CONFIG_CACHE_MAX_SIZE", 1024)),
+    ttl=float(settings.get("CONFIG_CACHE_TTL_SECONDS", 30))
+)
@@ -0,0 +1,173 @@
+from collections import Counter
+from typing import Any
+from pymongo import IndexModel, ASCENDING, TEXT
+from pymongo.errors import OperationFailure
+from data.models.asset_config import AssetConfig
+from data.models.sale import Sale
+from data.models.stock import Stock
+
+# Declarative index registry, reconciled against the database at startup.
+# Keyset pagination sorts on (field, _id), hence the `_id` suffix on the sortable fields.
+INDEXES: dict[str, list[IndexModel]] = {
+    "asset_config": [
+        IndexModel([("brand", ASCENDING), ("_id", ASCENDING)], name="brand_id"),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)], name="price_id"),
+        IndexModel([("RAM_gb", ASCENDING), ("ssd_size_gb", ASCENDING)], name="RAM_gb_ssd_size_gb"),
+    ],
+    "stock": [
+        IndexModel([("serial", ASCENDING)], name="serial_unique", unique=True),
+        IndexModel([("purchase_date", ASCENDING), ("_id", ASCENDING)], name="purchase_date_id"),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)], name="price_id"),
+        IndexModel([("current_status", ASCENDING), ("purchase_date", ASCENDING)], name="current_status_purchase_date"),
+        IndexModel([("current_status", ASCENDING), ("RAM_gb", ASCENDING), ("ssd_size_gb", ASCENDING)], name="current_status_RAM_gb_ssd_size_gb"),
+        # Stock search: text over model & remarks, compound indexes for the common spec combinations
+        IndexModel([("model", TEXT), ("remarks", TEXT)], name="model_remarks_text", weights={"model": 5, "remarks": 1}),
+        IndexModel([("current_status", ASCENDING), ("brand", ASCENDING), ("processor_type", ASCENDING), ("RAM", ASCENDING)], name="current_status_brand_processor_type_RAM"),
+        IndexModel([("current_status", ASCENDING), ("RAM", ASCENDING), ("ssd_size", ASCENDING), ("OS", ASCENDING)], name="current_status_RAM_ssd_size_OS"),
+    ],
+    "stock_events": [
+        IndexModel([("serial", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)], name="serial_date_id"),
+        IndexModel([("date", ASCENDING), ("_id", ASCENDING)], name="date_id"),
+    ],
+    "sale": [
+        IndexModel([("serial", ASCENDING), ("_id", ASCENDING)], name="serial_id"),
+        IndexModel([("sale_date", ASCENDING), ("_id", ASCENDING)], name="sale_date_id"),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)], name="price_id"),
+    ],
+    "sale_rollup": [
+        IndexModel([("day", ASCENDING), ("brand", ASCENDING), ("model", ASCENDING)], name="day_brand_model_unique", unique=True),
+    ],
+    "user": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+}
+
+# Models whose attributes can be filtered on through `compile_filter`, along with the range filtered fields
+FILTERABLE: dict[str, tuple[Any, list[str]]] = {
+    "asset_config": (AssetConfig, ["price", "RAM_gb", "ssd_size_gb"]),
+    "stock": (Stock, ["price", "purchase_date", "RAM_gb", "ssd_size_gb"]),
+    "sale": (Sale, ["price", "sale_date"]),
+}
+
+# Query shapes seen by the list endpoints, (equality fields, range fields, sort field) -> count
+MAX_OBSERVED_SHAPES = 256
+_observed_shapes: dict[str, Counter] = {}
+
+def _same_index(current: dict[str, Any], spec: dict[str, Any]) -> bool:
+    if bool(current.get("unique")) != bool(spec.get("unique")):
+        return False
+    if TEXT in spec["key"].values():
+        # Text indexes are stored as (_fts, _ftsx) keys, the indexed fields & their weights are kept separately
+        weights = spec.get("weights") or {field: 1 for field, kind in spec["key"].items() if kind == TEXT}
+        return current.get("weights") == weights
+    return list(current["key"]) == list(spec["key"].items())
+
+async def ensure_indexes(db) -> dict[str, dict[str, list[str]]]:
+    '''
+    Reconcile the indexes in the registry with the database. Missing indexes are created and
+    indexes whose definition changed are rebuilt, those already in place are left untouched.
+    Indexes that aren't part of the registry are never dropped.
+    '''
+    report: dict[str, dict[str, list[str]]] = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db.get_collection(collection_name)
+        existing = await collection.index_information()
+        result: dict[str, list[str]] = {"created": [], "rebuilt": [], "failed": []}
+
+        for index in indexes:
+            spec = index.document
+            current = existing.get(spec["name"])
+            if current and _same_index(current, spec):
+                continue
+            try:
+                if current:
+                    await collection.drop_index(spec["name"])
+                await collection.create_indexes([index])
+                result["rebuilt" if current else "created"].append(spec["name"])
+            except OperationFailure as e:
+                # Ex: unique index can't be built while duplicates exist in the collection
+                result["failed"].append(f"{spec['name']}: {e.details.get('errmsg') if e.details else e}")
+
+        report[collection_name] = result
+    return report
+
+def query_shape(filters: dict, sort_field: str = "_id") -> tuple[tuple[str, ...], tuple[str, ...], str]:
+    '''Reduce a find filter to its shape: the equality fields, the range fields & the sort field.'''
+    equality: set[str] = set()
+    ranges: set[str] = set()
+    for field, condition in filters.items():
+        if field in ("$and", "$or"):
+            for sub_filter in condition:
+                sub_equality, sub_ranges, _ = query_shape(sub_filter)
+                equality.update(sub_equality)
+                ranges.update(sub_ranges)
+        elif isinstance(condition, dict) and any(op in condition for op in ("$gt", "$gte", "$lt", "$lte", "$regex", "$ne", "$nin", "$not")):
+            ranges.add(field)
+        elif not field.startswith("$"):
+            equality.add(field)
+
+    # Fields compared both ways (ex: keyset pagination) are served as a range
+    equality -= ranges
+    ranges -= {sort_field, "_id"}
+    return tuple(sorted(equality)), tuple(sorted(ranges)), sort_field
+
+def record_query_shape(collection_name: str, filters: dict, sort_field: str = "_id"):
+    '''Count the shape of a query issued by the list endpoints, used by the index advisor.'''
+    shapes = _observed_shapes.setdefault(collection_name, Counter())
+    shape = query_shape(filters, sort_field)
+    if shape in shapes or len(shapes) < MAX_OBSERVED_SHAPES:
+        shapes[shape] += 1
+
+def _coverage(index_keys: list[str], shape: tuple[tuple[str, ...], tuple[str, ...], str]) -> int:
+    '''
+    Number of the query fields served by the leading keys of the index, following the
+    Equality, Sort, Range ordering. Returns 0 when the index can't be used for the query.
+    '''
+    equality, ranges, sort_field = shape
+    groups = [set(equality), {sort_field} - {"_id"}, set(ranges)]
+    matched = 0
+    keys = iter(index_keys)
+    key = next(keys, None)
+    for group in filter(None, groups):
+        while key in group:
+            group.discard(key)
+            matched += 1
+            key = next(keys, None)
+        if group:
+            break
+    return matched if len(equality) == 0 or matched >= len(equality) else 0
+
+async def advise_indexes(db) -> list[dict[str, Any]]:
+    '''
+    Report the single field query shapes that `compile_filter` can produce (plus those observed at runtime)
+    along with the best index serving each of them. Shapes without a usable index result in
+    collection scans.
+    '''
+    report: list[dict[str, Any]] = []
+    for collection_name, (model, range_fields) in FILTERABLE.items():
+        indexes = await db.get_collection(collection_name).index_information()
+        index_keys = {name: [k for k, _ in info["key"]] for name, info in indexes.items()}
+
+        shapes: dict[tuple, dict[str, Any]] = {}
+        for field in model.__fields__.keys():
+            shape = ((), (field,), "_id") if field in range_fields else ((field,), (), "_id")
+            shapes[shape] = {"source": "filter", "count": 0}
+        for shape, count in _observed_shapes.get(collection_name, Counter()).items():
+            shapes[shape] = {"source": "observed", "count": count}
+
+        for shape, detail in shapes.items():
+            equality, ranges, sort_field = shape
+            wanted = len(equality) + len(ranges) + (sort_field != "_id")
+            best_index, best_score = None, 0
+            for name, keys in index_keys.items():
+                score = _coverage(keys, shape)
+                if score > best_score:
+                    best_index, best_score = name, score
+
+            report.append({
+                "collection": collection_name, "equality": list(equality), "range": list(ranges), "sort": sort_field,
+                **detail, "index": best_index if wanted else "_id_",
+                "coverage": "full" if best_score >= wanted else ("partial" if best_score else "none")
+            })
+
+    return report
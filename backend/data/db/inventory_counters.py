@@ -0,0 +1,90 @@
+from collections import defaultdict, Counter
+from typing import Any
+from pymongo import UpdateOne
+from data.db.client import mongo_client
+from data.db.collection_versions import bump_versions
+from data.models.stock import StockStatusEnum
+import datetime as dt
+
+# Counter documents are keyed by the config ID, along with these special keys
+ALL_CONFIGS = "all"
+UNASSIGNED = "unassigned" # Stocks created before the config ID was recorded on them
+
+def _key(config_id: str | None) -> str:
+    return str(config_id) if config_id else UNASSIGNED
+
+def _status(status: StockStatusEnum | str) -> str:
+    return status.value if isinstance(status, StockStatusEnum) else str(status)
+
+def counter_changes(transitions: list[tuple[str | None, Any, Any]]) -> list[UpdateOne]:
+    '''
+    Build the increments for the `inventory_counter` collection from the (config ID, from status, to status)
+    transitions. `from status` is None for newly created stocks and `to status` is None for hard deletes.
+    '''
+    increments: dict[str, Counter] = defaultdict(Counter)
+    for config_id, from_status, to_status in transitions:
+        for key in (_key(config_id), ALL_CONFIGS):
+            if from_status:
+                increments[key][_status(from_status)] -= 1
+            if to_status:
+                increments[key][_status(to_status)] += 1
+
+    changes: list[UpdateOne] = []
+    for key, counts in increments.items():
+        counts = {f"counts.{status}": count for status, count in counts.items() if count != 0}
+        if counts:
+            changes.append(UpdateOne({"_id": key}, {"$inc": counts, "$set": {"update_date": dt.datetime.utcnow()}}, upsert=True))
+    return changes
+
+async def apply_counter_changes(transitions: list[tuple[str | None, Any, Any]], session=None):
+    '''Apply the status transitions to the counters, pass in the session to make them part of the caller's transaction.'''
+    changes = counter_changes(transitions)
+    if changes:
+        await mongo_client.inventory_counter.bulk_write(changes, ordered=False, session=session)
+
+async def inventory_summary(config_id: str | None = None) -> list[dict[str, Any]]:
+    '''Stock counts per status, for a single config (or across all of them when not provided).'''
+    counter = await mongo_client.reporting.inventory_counter.find_one({"_id": config_id or ALL_CONFIGS})
+    if not counter:
+        return []
+    counts = counter.get("counts", {})
+    return [{"config_id": counter["_id"], **{status.value: counts.get(status.value, 0) for status in StockStatusEnum}}]
+
+async def recompute_counters() -> dict[str, dict[str, int]]:
+    '''Recount the stocks per config & status straight from the `stock` collection.'''
+    expected: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    pipeline = [{"$group": {"_id": {"config_id": "$config_id", "status": "$current_status"}, "count": {"$sum": 1}}}]
+    async for group in mongo_client.stock.aggregate(pipeline):
+        status = group["_id"]["status"]
+        expected[_key(group["_id"].get("config_id"))][status] += group["count"]
+        expected[ALL_CONFIGS][status] += group["count"]
+    return expected
+
+async def check_counters(fix: bool = False) -> list[dict[str, Any]]:
+    '''
+    Compare the counters with a fresh recount & report the drift. With `fix`, the counters that
+    drifted are overwritten with the recount. Transitions made while the check runs could show
+    up as drift, so it is best run when the shop is idle.
+    '''
+    expected = await recompute_counters()
+    actual = {counter["_id"]: counter.get("counts", {}) async for counter in mongo_client.inventory_counter.find({})}
+
+    drift: list[dict[str, Any]] = []
+    repairs: list[UpdateOne] = []
+    for key in set(expected) | set(actual):
+        expected_counts, actual_counts = expected.get(key, {}), actual.get(key, {})
+        drifted = [
+            {"config_id": key, "status": status, "expected": expected_counts.get(status, 0), "actual": actual_counts.get(status, 0)}
+            for status in set(expected_counts) | set(actual_counts)
+            if expected_counts.get(status, 0) != actual_counts.get(status, 0)
+        ]
+        if drifted:
+            drift.extend(drifted)
+            repairs.append(UpdateOne(
+                {"_id": key}, {"$set": {"counts": dict(expected_counts), "update_date": dt.datetime.utcnow()}}, upsert=True
+            ))
+
+    if fix and repairs:
+        await mongo_client.inventory_counter.bulk_write(repairs, ordered=False)
+        await bump_versions("inventory_counter")
+    return drift
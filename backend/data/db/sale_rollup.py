@@ -0,0 +1,104 @@
+from collections import defaultdict
+from typing import Any
+from pymongo import UpdateOne
+from data.db.client import mongo_client
+from data.db.collection_versions import bump_versions
+from data.models.sale import SaleAnalyticsGranularityEnum
+import datetime as dt
+
+# Fields of the sold stock that the rollups are grouped by (along with the sale day)
+ROLLUP_DIMENSIONS = ["brand", "model"]
+
+def _day(date: dt.datetime) -> dt.datetime:
+    return dt.datetime(date.year, date.month, date.day)
+
+def rollup_changes(entries: list[tuple[dt.datetime, dict[str, Any], float, int]]) -> list[UpdateOne]:
+    '''
+    Build the upserts for the `sale_rollup` collection from (sale date, sold stock, price, units)
+    entries. Units are +1 for a sale and -1 for a sale that is reversed, entries for the same
+    bucket are merged & those that cancel out are skipped.
+    '''
+    increments: dict[tuple, list[float]] = defaultdict(lambda: [0.0, 0])
+    for sale_date, stock, price, units in entries:
+        key = (_day(sale_date), *(stock.get(dimension) for dimension in ROLLUP_DIMENSIONS))
+        increments[key][0] += price * units
+        increments[key][1] += units
+
+    return [
+        UpdateOne(
+            {"day": day, **dict(zip(ROLLUP_DIMENSIONS, dimensions))},
+            {"$inc": {"revenue": revenue, "units": units}, "$set": {"update_date": dt.datetime.utcnow()}},
+            upsert=True
+        )
+        for (day, *dimensions), (revenue, units) in increments.items() if units != 0 or revenue != 0
+    ]
+
+async def apply_rollup_changes(entries: list[tuple[dt.datetime, dict[str, Any], float, int]], session=None):
+    '''Apply the rollup changes, pass in the session to make them part of the caller's transaction.'''
+    changes = rollup_changes(entries)
+    if changes:
+        await mongo_client.sale_rollup.bulk_write(changes, ordered=False, session=session)
+
+async def sales_analytics(
+        granularity: SaleAnalyticsGranularityEnum, group_by: list[str],
+        start: dt.datetime | None = None, end: dt.datetime | None = None
+    ) -> list[dict[str, Any]]:
+    '''
+    Time bucketed revenue, unit count & average price read from the daily rollups. The cost
+    depends on the number of buckets in the range, not on the number of sales.
+    '''
+    match: dict[str, Any] = {}
+    if start:
+        match["$gte"] = _day(start)
+    if end:
+        match["$lte"] = end
+
+    pipeline: list[dict[str, Any]] = [
+        {"$match": {"day": match} if match else {}},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateTrunc": {"date": "$day", "unit": granularity.value}},
+                **{dimension: f"${dimension}" for dimension in group_by}
+            },
+            "revenue": {"$sum": "$revenue"},
+            "units": {"$sum": "$units"}
+        }},
+        {"$match": {"units": {"$gt": 0}}},
+        {"$project": {
+            "_id": 0, "bucket": "$_id.bucket", **{dimension: f"$_id.{dimension}" for dimension in group_by},
+            "revenue": 1, "units": 1, "average_price": {"$divide": ["$revenue", "$units"]}
+        }},
+        {"$sort": {"bucket": 1, **{dimension: 1 for dimension in group_by}}}
+    ]
+    return [bucket async for bucket in mongo_client.reporting.sale_rollup.aggregate(pipeline)]
+
+async def rebuild_sale_rollups() -> int:
+    '''
+    Recompute the `sale_rollup` collection from scratch out of the `sale` & `stock` collections,
+    meant for backfills. The result replaces the collection atomically, sales made while the job
+    runs might be missed so it should be run when the shop is idle.
+    '''
+    pipeline: list[dict[str, Any]] = [
+        {"$lookup": {
+            "from": "stock", "localField": "serial", "foreignField": "serial", "as": "stock",
+            "pipeline": [{"$project": {dimension: 1 for dimension in ROLLUP_DIMENSIONS}}]
+        }},
+        {"$unwind": {"path": "$stock", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateTrunc": {"date": "$sale_date", "unit": "day"}},
+                **{dimension: {"$ifNull": [f"$stock.{dimension}", None]} for dimension in ROLLUP_DIMENSIONS}
+            },
+            "revenue": {"$sum": "$price"},
+            "units": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0, "day": "$_id.day", **{dimension: f"$_id.{dimension}" for dimension in ROLLUP_DIMENSIONS},
+            "revenue": 1, "units": 1, "update_date": "$$NOW"
+        }},
+        {"$out": "sale_rollup"}
+    ]
+    async for _ in mongo_client.sale.aggregate(pipeline):
+        pass
+    await bump_versions("sale_rollup")
+    return await mongo_client.sale_rollup.count_documents({})
@@ -0,0 +1,167 @@
+from collections import Counter
+from typing import Any
+import asyncio
+import datetime as dt
+import json
+import threading
+from pymongo import monitoring
+from utils.util import settings
+from utils.metrics import current_route
+
+SLOW_QUERY_THRESHOLD_MS = float(settings.get("SLOW_QUERY_THRESHOLD_MS", 100))
+SLOW_QUERY_EXPLAIN = settings.get("SLOW_QUERY_EXPLAIN", "False") == "True"
+SLOW_QUERY_MAX_SHAPES = int(settings.get("SLOW_QUERY_MAX_SHAPES", 256))
+
+# Parts of the commands that make up their shape, everything else (sessions, cluster time, inserted documents ..) is left out
+SHAPE_FIELDS = ("filter", "query", "q", "sort", "projection", "fields", "pipeline", "update", "u", "updates", "deletes", "key", "hint")
+# Values kept as is in the shape, sort directions & index hints don't leak any data
+UNREDACTED_FIELDS = ("sort", "$sort", "hint")
+# Read commands that are explained (with `executionStats`) the first time their shape is seen
+EXPLAINABLE = {
+    "find": ("filter", "sort", "projection", "skip", "limit", "hint", "collation"),
+    "aggregate": ("pipeline", "hint", "collation"),
+    "count": ("query", "hint", "collation"),
+    "distinct": ("key", "query", "collation"),
+}
+
+def redact(value: Any, keep: bool = False) -> Any:
+    '''Replace the values of a filter / pipeline with `?`, keeping the field names & operators. Identical list items are collapsed.'''
+    if isinstance(value, dict):
+        return {k: redact(v, keep or k in UNREDACTED_FIELDS) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items: list[Any] = []
+        for item in (redact(v, keep) for v in value):
+            if item not in items:
+                items.append(item)
+        return items
+    return value if keep else "?"
+
+def command_shape(command: dict[str, Any]) -> dict[str, Any]:
+    return {field: redact(command[field], field in UNREDACTED_FIELDS) for field in SHAPE_FIELDS if field in command}
+
+def _plan_summary(explain: dict[str, Any]) -> dict[str, Any]:
+    '''Stages & indexes of the winning plan(s) along with the execution stats, found anywhere in the explain output.'''
+    stages: list[str] = []
+    indexes: list[str] = []
+    stats: dict[str, Any] = {}
+
+    def walk(node: Any, in_plan: bool = False):
+        if isinstance(node, dict):
+            if in_plan and "stage" in node:
+                stages.append(node["stage"])
+            if in_plan and "indexName" in node and node["indexName"] not in indexes:
+                indexes.append(node["indexName"])
+            for key in ("nReturned", "executionTimeMillis", "totalKeysExamined", "totalDocsExamined"):
+                if key in node and key not in stats:
+                    stats[key] = node[key]
+            for key, child in node.items():
+                walk(child, in_plan or key in ("winningPlan", "queryPlan"))
+        elif isinstance(node, list):
+            for child in node:
+                walk(child, in_plan)
+
+    walk(explain)
+    return {"stages": stages, "indexes": indexes, **stats}
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    '''
+    Records the commands that take longer than the threshold, grouped by their shape (values redacted)
+    along with the routes that issued them. The listener is invoked on the executor threads that run
+    the driver calls, the route is read from the context variable that Motor copies over to them.
+    '''
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, explain: bool = SLOW_QUERY_EXPLAIN, max_shapes: int = SLOW_QUERY_MAX_SHAPES):
+        self.threshold_ms, self.explain, self.max_shapes = threshold_ms, explain, max_shapes
+        self._pending: dict[tuple[Any, int], tuple[dict[str, Any], str, str]] = {}
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._client = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def attach(self, client, loop: asyncio.AbstractEventLoop):
+        '''Client & event loop that the explain commands are run on.'''
+        self._client, self._loop = client, loop
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in ("explain", "getMore", "hello", "ismaster", "endSessions"):
+            return
+        self._pending[(event.connection_id, event.request_id)] = (event.command, event.database_name, current_route.get())
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._complete(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._complete(event, failed=True)
+
+    def _complete(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+
+        command, database_name, route = pending
+        collection = command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else database_name
+        shape = command_shape(command)
+        key = json.dumps([collection, event.command_name, shape], sort_keys=True, default=str)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_shapes:
+                    # Make room by evicting the shape that cost the least overall
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k]["total_ms"])]
+                entry = self._entries[key] = {
+                    "collection": collection, "command": event.command_name, "shape": shape, "count": 0, "failed": 0,
+                    "total_ms": 0.0, "max_ms": 0.0, "routes": Counter(), "first_seen": dt.datetime.utcnow(), "explain": None
+                }
+                explain = self.explain and not failed
+            else:
+                explain = False
+            entry["count"] += 1
+            entry["failed"] += failed
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = dt.datetime.utcnow()
+            entry["routes"][route] += 1
+
+        if explain:
+            self._schedule_explain(entry, event.command_name, command, database_name)
+
+    def _schedule_explain(self, entry: dict[str, Any], command_name: str, command: dict[str, Any], database_name: str):
+        fields = EXPLAINABLE.get(command_name)
+        if not fields or self._client is None or self._loop is None or self._loop.is_closed():
+            return
+        if command_name == "aggregate" and any("$out" in stage or "$merge" in stage for stage in command.get("pipeline", [])):
+            return
+        target = {command_name: command[command_name], **{f: command[f] for f in fields if f in command}}
+        if command_name == "aggregate":
+            target["cursor"] = {}
+
+        async def run():
+            try:
+                result = await self._client[database_name].command({"explain": target, "verbosity": "executionStats"})
+                entry["explain"] = _plan_summary(result)
+            except Exception as e:
+                entry["explain"] = {"error": str(e)}
+
+        asyncio.run_coroutine_threadsafe(run(), self._loop)
+
+    def top(self, limit: int = 20, sort_by: str = "total_ms") -> list[dict[str, Any]]:
+        '''The recorded shapes, most expensive first.'''
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e[sort_by], reverse=True)[:limit]
+            return [
+                {
+                    **{k: v for k, v in e.items() if k != "routes"}, "routes": dict(e["routes"].most_common()),
+                    "total_ms": round(e["total_ms"], 2), "max_ms": round(e["max_ms"], 2), "mean_ms": round(e["total_ms"] / e["count"], 2)
+                }
+                for e in entries
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+# Registered on the mongo client, shared by the whole worker
+slow_query_recorder = SlowQueryRecorder()
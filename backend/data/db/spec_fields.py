@@ -0,0 +1,30 @@
+from typing import Any
+from pymongo import UpdateOne
+from data.db.client import mongo_client
+from data.db.collection_versions import bump_versions
+from utils.specs import SPEC_FIELDS, normalize_specs
+
+async def backfill_spec_fields(recompute: bool = False, batch_size: int = 500) -> dict[str, int]:
+    '''
+    Set the numeric spec fields on the configs & stocks written before they were introduced. Only the
+    documents missing any of them are updated, unless `recompute` (ex: after the parsing rules changed).
+    Returns the number of documents updated per collection.
+    '''
+    query: dict[str, Any] = {} if recompute else {"$or": [{numeric: {"$exists": False}} for numeric, _, _ in SPEC_FIELDS.values()]}
+    projection = {field: 1 for field in SPEC_FIELDS}
+
+    updated: dict[str, int] = {}
+    for collection in (mongo_client.asset_config, mongo_client.stock):
+        updated[collection.name] = 0
+        changes: list[UpdateOne] = []
+        async for document in collection.find(query, projection).batch_size(batch_size):
+            numeric = normalize_specs({field: document.get(field) for field in SPEC_FIELDS})
+            changes.append(UpdateOne({"_id": document["_id"]}, {"$set": {k: v for k, v in numeric.items() if k not in SPEC_FIELDS}}))
+            if len(changes) >= batch_size:
+                updated[collection.name] += (await collection.bulk_write(changes, ordered=False)).modified_count
+                changes = []
+        if changes:
+            updated[collection.name] += (await collection.bulk_write(changes, ordered=False)).modified_count
+
+    await bump_versions("asset_config", "stock")
+    return updated
@@ -0,0 +1,59 @@
+from typing import Any
+from pymongo import UpdateOne
+from data.db.client import mongo_client
+from data.db.collection_versions import bump_versions
+from data.models.stock import StockEvent, StockStatusEnum
+import datetime as dt
+
+async def record_events(
+        stocks: list[dict[str, Any]], user: dict[str, Any], status: StockStatusEnum | None = None, 
+        date: dt.datetime | None = None, session=None
+    ):
+    '''
+    Append the status changes of the stocks to `stock_events`. The stocks' `current_status` is used 
+    when `status` isn't provided, pass in the session to make them part of the caller's transaction.
+    '''
+    events = [
+        StockEvent(
+            serial=stock["serial"], status=status or stock["current_status"], date=date or dt.datetime.utcnow(),
+            config_id=stock.get("config_id"), created_by=user["AH_USER"]
+        ).dict()
+        for stock in stocks
+    ]
+    if events:
+        await mongo_client.stock_events.insert_many(events, ordered=False, session=session)
+
+async def migrate_status_history(batch_size: int = 500) -> tuple[int, int]:
+    '''
+    Move the `status_history` arrays embedded in the stocks over to `stock_events`. Events are upserted 
+    on (serial, status, date) so the migration can safely be re-run if interrupted. Returns the number 
+    of stocks migrated & events written.
+    '''
+    migrated = written = 0
+    cursor = mongo_client.stock.find(
+        {"status_history": {"$exists": True}}, {"serial": 1, "config_id": 1, "created_by": 1, "status_history": 1}
+    ).batch_size(batch_size)
+
+    async for stock in cursor:
+        events = [
+            UpdateOne(
+                {"serial": stock["serial"], "status": entry["status"], "date": entry["date"]},
+                {"$setOnInsert": {"config_id": stock.get("config_id"), "created_by": stock.get("created_by")}},
+                upsert=True
+            )
+            for entry in stock["status_history"] if entry.get("status") and entry.get("date")
+        ]
+        if events:
+            result = await mongo_client.stock_events.bulk_write(events, ordered=False)
+            written += result.upserted_count
+
+        # Latest status date, so that the stock keeps it after the array is dropped
+        dates = [entry["date"] for entry in stock["status_history"] if entry.get("date")]
+        update: dict[str, Any] = {"$unset": {"status_history": ""}}
+        if dates:
+            update["$set"] = {"status_date": max(dates)}
+        await mongo_client.stock.update_one({"_id": stock["_id"]}, update)
+        migrated += 1
+
+    await bump_versions("stock", "stock_events")
+    return migrated, written
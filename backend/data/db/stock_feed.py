@@ -0,0 +1,121 @@
+from typing import Any
+from pymongo.errors import PyMongoError
+from data.db.client import mongo_client
+from data.db.change_streams import watch_collection
+from utils.util import settings
+import asyncio
+import re
+
+STOCK_FEED_QUEUE_SIZE = int(settings.get("STOCK_FEED_QUEUE_SIZE", 256))
+STOCK_FEED_REPLAY_LIMIT = int(settings.get("STOCK_FEED_REPLAY_LIMIT", 1000))
+
+# `_data` of the change streams' resume tokens, the ids of the events sent to the clients
+RESUME_TOKEN = re.compile(r"(?:[0-9A-Fa-f]{2})+")
+
+# Inserted events only (`stock_events` is append only), without the change stream's metadata
+FEED_PIPELINE = [
+    {"$match": {"operationType": "insert"}},
+    {"$project": {"fullDocument": 1}},
+]
+
+class Subscriber:
+    '''
+    A client of the feed, with its own bounded queue. A client that doesn't keep up is marked `lagged`
+    instead of holding up the others (or growing without bounds), it is expected to resume from the last
+    event it received (see `StockFeed.replay`).
+    '''
+
+    def __init__(self, statuses: set[str], config_ids: set[str], max_size: int = STOCK_FEED_QUEUE_SIZE):
+        self.statuses = statuses
+        self.config_ids = config_ids
+        self.queue: asyncio.Queue[tuple[str, dict[str, Any]]] = asyncio.Queue(max_size)
+        self.lagged = asyncio.Event()
+
+    def matches(self, event: dict[str, Any]) -> bool:
+        return (not self.statuses or event.get("status") in self.statuses) and \
+            (not self.config_ids or event.get("config_id") in self.config_ids)
+
+    def offer(self, token: str, event: dict[str, Any]):
+        if self.lagged.is_set() or not self.matches(event):
+            return
+        try:
+            self.queue.put_nowait((token, event))
+        except asyncio.QueueFull:
+            self.lagged.set()
+
+class StockFeed:
+    '''
+    Fans the stock status changes out to the subscribed clients. A single change stream per worker tails the
+    inserts into `stock_events`, so the clients see the changes made through every worker & only once they
+    are committed. Events are identified by their position in the stream (its resume token) which, unlike their `_id`,
+    follows the commit order. When the stream is lost the clients are told to resume (`replay`), as they would miss
+    events meanwhile.
+    '''
+
+    def __init__(self):
+        self.live = False
+        self.published = 0
+        self.subscribers: set[Subscriber] = set()
+        self._watcher: asyncio.Task | None = None
+
+    def subscribe(self, statuses: set[str], config_ids: set[str]) -> Subscriber:
+        subscriber = Subscriber(statuses, config_ids)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, change: dict[str, Any]):
+        self.published += 1
+        for subscriber in self.subscribers:
+            subscriber.offer(change["_id"]["_data"], change["fullDocument"])
+
+    def _set_live(self, live: bool):
+        if self.live and not live:
+            # Events are missed until the stream is back, the clients resume from `stock_events` instead
+            for subscriber in self.subscribers:
+                subscriber.lagged.set()
+        self.live = live
+
+    async def replay(self, subscriber: Subscriber, after: str) -> tuple[list[tuple[str, dict[str, Any]]], bool]:
+        '''
+        The events (along with their ids) matching the subscriber's filters committed after the event `after`, for
+        the clients resuming the feed. Read from a change stream resumed after that event, up to the latest one.
+        Also returns whether the events can't all be replayed: there are more than `STOCK_FEED_REPLAY_LIMIT` or
+        the event is no longer in the oplog.
+        '''
+        events: list[tuple[str, dict[str, Any]]] = []
+        try:
+            async with mongo_client.stock_events.watch(FEED_PIPELINE, resume_after={"_data": after}) as stream:
+                while change := await stream.try_next():
+                    if subscriber.matches(change["fullDocument"]):
+                        events.append((change["_id"]["_data"], change["fullDocument"]))
+                        if len(events) > STOCK_FEED_REPLAY_LIMIT:
+                            return events[:STOCK_FEED_REPLAY_LIMIT], True
+        except PyMongoError:
+            return [], True
+        return events, False
+
+    def start(self):
+        '''Start tailing `stock_events`, once per worker after the connection is established.'''
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(watch_collection(
+                mongo_client.stock_events, FEED_PIPELINE,
+                self.publish, self._set_live, "stock feed"
+            ))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        self.live = False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "change_stream": self.live, "subscribers": len(self.subscribers), "published": self.published,
+            "lagged": sum(1 for subscriber in self.subscribers if subscriber.lagged.is_set())
+        }
+
+stock_feed = StockFeed()
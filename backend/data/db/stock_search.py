@@ -0,0 +1,54 @@
+from typing import Any
+from data.db.client import mongo_client
+
+# Specification fields the search returns value counts for
+SEARCH_FACETS = ["brand", "processor_type", "RAM", "ssd_size", "OS"]
+
+def _and(*filters: dict[str, Any]) -> dict[str, Any]:
+    filters = tuple(f for f in filters if f)
+    return filters[0] if len(filters) == 1 else ({"$and": list(filters)} if filters else {})
+
+async def search_stocks(
+        text: str, filters: dict[str, Any], selections: dict[str, dict[str, Any]],
+        projection: dict[str, int], limit: int, offset: int = 0
+    ) -> dict[str, Any]:
+    '''
+    Matching stocks along with the value counts of every facet, in a single `$facet` aggregation.
+    The text search & `filters` run first so they can use the indexes. The facet `selections`
+    (facet -> filter) are applied after, each facet's counts ignore its own selection so that
+    the counts of the other values stay visible to pick from.
+    '''
+    pipeline: list[dict[str, Any]] = [{"$match": _and({"$text": {"$search": text}} if text else {}, filters)}]
+    if text:
+        pipeline.append({"$set": {"score": {"$meta": "textScore"}}})
+
+    selected = _and(*selections.values())
+    items: list[dict[str, Any]] = [
+        {"$match": selected},
+        {"$sort": {"score": -1, "_id": 1} if text else {"_id": 1}},
+        {"$skip": offset},
+        {"$limit": limit}
+    ]
+    if projection:
+        items.append({"$project": {**projection, **({"score": 1} if text else {})}})
+
+    pipeline.append({"$facet": {
+        "items": items,
+        "total": [{"$match": selected}, {"$count": "count"}],
+        **{
+            facet: [
+                {"$match": _and(*(f for name, f in selections.items() if name != facet))},
+                {"$sortByCount": f"${facet}"},
+                {"$project": {"_id": 0, "value": "$_id", "count": 1}}
+            ]
+            for facet in SEARCH_FACETS
+        }
+    }})
+
+    result = await mongo_client.reporting.stock.aggregate(pipeline).to_list(length=1)
+    result = result[0] if result else {}
+    return {
+        "items": result.get("items", []),
+        "total": result["total"][0]["count"] if result.get("total") else 0,
+        "facets": {facet: result.get(facet, []) for facet in SEARCH_FACETS}
+    }
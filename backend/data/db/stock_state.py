@@ -0,0 +1,190 @@
+from typing import Any
+from collections import Counter
+from pymongo import UpdateOne
+from bson import ObjectId
+from data.db.client import mongo_client
+from data.db.inventory_counters import apply_counter_changes
+from data.db.stock_events import record_events
+from data.db.collection_versions import bump_versions
+from data.db.transactions import run_in_transaction
+from data.models.stock import StockStatusEnum, BulkStockUpdate
+from utils.specs import normalize_specs
+import datetime as dt
+
+# Status a stock can be moved to -> statuses it can be moved from. Stocks are only ever `new` when created.
+ALLOWED_TRANSITIONS: dict[StockStatusEnum, tuple[StockStatusEnum, ...]] = {
+    StockStatusEnum.sold: (StockStatusEnum.new, StockStatusEnum.refurbished),
+    StockStatusEnum.returned: (StockStatusEnum.sold,),
+    StockStatusEnum.refurbished: (StockStatusEnum.returned,),
+    StockStatusEnum.deleted: (StockStatusEnum.new, StockStatusEnum.refurbished, StockStatusEnum.returned, StockStatusEnum.sold),
+}
+
+# Collections written by a status change, along with the stock itself
+TRANSITION_COLLECTIONS = ("stock", "stock_events", "inventory_counter")
+
+# Fields of the stocks (as they were before the transition) returned to the callers
+TRANSITION_PROJECTION = {"serial": 1, "current_status": 1, "config_id": 1, "brand": 1, "model": 1}
+
+class TransitionConflict(Exception):
+    '''
+    Raised when stocks can't be moved to the target status. `conflicts` maps each of those serials
+    to its current status, None when the serial doesn't exist.
+    '''
+
+    def __init__(self, conflicts: dict[str, str | None]):
+        self.conflicts = conflicts
+        super().__init__(", ".join(f"{serial}: {current or 'not found'}" for serial, current in conflicts.items()))
+
+    def describe(self) -> dict[str, str]:
+        return {serial: current or "not found" for serial, current in self.conflicts.items()}
+
+async def transition_stocks(
+        serials: list[str], to_status: StockStatusEnum, user: dict[str, Any],
+        set_fields: dict[str, Any] | None = None, session=None
+    ) -> list[dict[str, Any]]:
+    '''
+    Move the stocks to `to_status`. The stocks are read once (their before images, for the counters & rollups)
+    and moved with a single `bulk_write` of updates conditional on the status that was read, so a stock can
+    never be sold twice. Returns the stocks as they were before the transition, records the events & keeps
+    the inventory counters in step. Callers bump the `TRANSITION_COLLECTIONS` versions, after the transaction commits.
+
+    Raises TransitionConflict listing every serial that couldn't be moved, stocks that were moved already
+    are rolled back only when a session with a transaction is passed in. `set_fields` are aggregation
+    expressions, literal values must be wrapped in `$literal`.
+    '''
+    stocks = {
+        stock["serial"]: stock
+        async for stock in mongo_client.stock.find({"serial": {"$in": serials}}, TRANSITION_PROJECTION, session=session)
+    }
+    conflicts = {
+        serial: stocks[serial]["current_status"] if serial in stocks else None
+        for serial in serials if stocks.get(serial, {}).get("current_status") not in ALLOWED_TRANSITIONS[to_status]
+    }
+    if conflicts:
+        raise TransitionConflict(conflicts)
+
+    # Marks the stocks moved by this call, in case some of them changed since they were read
+    token, date = ObjectId(), dt.datetime.utcnow()
+    result = await mongo_client.stock.bulk_write([
+        # Pipeline update, so that the `set_fields` can be computed from the stock's own fields
+        UpdateOne({"serial": serial, "current_status": stocks[serial]["current_status"]}, [{"$set": {
+            "current_status": {"$literal": to_status}, "status_date": date, "update_date": user["AH_DATE"](),
+            "updated_by": {"$literal": user["AH_USER"]}, "update_token": token, **(set_fields or {})
+        }}])
+        for serial in serials
+    ], ordered=False, session=session)
+
+    moved = [stocks[serial] for serial in serials]
+    if result.matched_count < len(serials):
+        # Only on conflicts, find out which stocks were moved & why the others weren't
+        current = {
+            stock["serial"]: stock
+            async for stock in mongo_client.stock.find({"serial": {"$in": serials}}, {"serial": 1, "current_status": 1, "update_token": 1}, session=session)
+        }
+        moved = [stocks[serial] for serial in serials if current.get(serial, {}).get("update_token") == token]
+        conflicts = {
+            serial: current[serial]["current_status"] if serial in current else None
+            for serial in serials if current.get(serial, {}).get("update_token") != token
+        }
+
+    await record_events(moved, user, to_status, date, session=session)
+    await apply_counter_changes([(stock.get("config_id"), stock["current_status"], to_status) for stock in moved], session=session)
+    if conflicts:
+        raise TransitionConflict(conflicts)
+    return moved
+
+def transition_error(from_status: str, to_status: StockStatusEnum | None) -> str | None:
+    '''The reason a stock can't be moved to the status, None when it can (or its status is left as is).'''
+    if to_status is None or to_status == from_status or from_status in ALLOWED_TRANSITIONS.get(to_status, ()):
+        return None
+    return f"Can't be moved from {from_status} to {StockStatusEnum(to_status).value}."
+
+def _bulk_changes(item: BulkStockUpdate, stock: dict[str, Any] | None) -> tuple[dict[str, Any], str | None]:
+    '''Fields to `$set` on the stock, or the reason the update can't be applied.'''
+    if stock is None:
+        return {}, "Serial# doesn't exist."
+    changes = {k: v for k, v in item.update.dict().items() if v is not None and k not in ("created_by", "create_date")}
+    if "serial" in changes and changes["serial"] != item.serial:
+        return {}, "Serial# can't be changed in a bulk update."
+    changes.pop("serial", None)
+    if not changes:
+        return {}, "Atleast one of the fields to be present."
+
+    error = transition_error(stock["current_status"], changes.get("current_status"))
+    if error:
+        return {}, error
+    return normalize_specs(changes), None
+
+async def bulk_update_stocks(items: list[BulkStockUpdate], user: dict[str, Any]) -> list[dict[str, Any]]:
+    '''
+    Apply partial updates (& status transitions) to many stocks, in a transaction: a single read of their current
+    status, then a single unordered `bulk_write` of field level `$set`s. Each update is conditional on the status
+    that was read, so a stock moved meanwhile is reported as a conflict instead of being overwritten. Returns the
+    outcome per serial, records the events & keeps the inventory counters in step for the stocks that were moved.
+    Raises TransactionRetriesExhausted when the transaction kept conflicting with concurrent ones.
+    '''
+    serials = [item.serial for item in items]
+    repeated = {serial: "Serial# is repeated in the request." for serial, count in Counter(serials).items() if count > 1}
+
+    async def update(session) -> tuple[dict[str, str], bool]:
+        # Marks the stocks updated by this request, in case some of them changed since they were read
+        token, date = ObjectId(), user["AH_DATE"]()
+        current = {
+            stock["serial"]: stock
+            async for stock in mongo_client.stock.find(
+                {"serial": {"$in": serials}}, {"serial": 1, "current_status": 1, "config_id": 1}, session=session
+            )
+        }
+
+        errors = dict(repeated)
+        operations: list[UpdateOne] = []
+        planned: list[tuple[dict[str, Any], dict[str, Any]]] = []
+        for item in items:
+            if item.serial in errors:
+                continue
+            stock = current.get(item.serial)
+            changes, error = _bulk_changes(item, stock)
+            if error:
+                errors[item.serial] = error
+                continue
+            if changes.get("current_status", stock["current_status"]) != stock["current_status"]:
+                changes["status_date"] = date
+            changes.update({"update_date": date, "updated_by": user["AH_USER"], "update_token": token})
+            operations.append(UpdateOne({"serial": item.serial, "current_status": stock["current_status"]}, {"$set": changes}))
+            planned.append((stock, changes))
+
+        if not operations:
+            return errors, False
+
+        result = await mongo_client.stock.bulk_write(operations, ordered=False, session=session)
+        if result.matched_count < len(planned):
+            # Only on conflicts, the stocks updated by this request are the ones carrying its token
+            updated = {
+                stock["serial"] async for stock in mongo_client.stock.find(
+                    {"serial": {"$in": [stock["serial"] for stock, _ in planned]}, "update_token": token}, {"serial": 1}, session=session
+                )
+            }
+            errors.update({
+                stock["serial"]: "Status was changed concurrently. Please try again." for stock, _ in planned if stock["serial"] not in updated
+            })
+
+        moved = [
+            (stock, changes["current_status"]) for stock, changes in planned
+            if stock["serial"] not in errors and changes.get("current_status", stock["current_status"]) != stock["current_status"]
+        ]
+        if moved:
+            await record_events([{**stock, "current_status": to_status} for stock, to_status in moved], user, date=date, session=session)
+            await apply_counter_changes(
+                [(stock.get("config_id"), stock["current_status"], to_status) for stock, to_status in moved], session=session
+            )
+        return errors, True
+
+    errors, written = await run_in_transaction(update)
+    if written:
+        await bump_versions(*TRANSITION_COLLECTIONS)
+
+    return [
+        {"serial": item.serial, "status": "failed", "error": errors[item.serial]} if item.serial in errors else
+        {"serial": item.serial, "status": "updated"}
+        for item in items
+    ]
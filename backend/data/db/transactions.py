@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, TypeVar
+from pymongo.errors import PyMongoError
+from data.db.client import mongo_client
+
+T = TypeVar("T")
+
+# Write conflicts with another transaction (ex: on the shared inventory counters), retried by `with_transaction`
+RETRIED_ERROR_LABELS = ("TransientTransactionError", "UnknownTransactionCommitResult")
+
+# Message of the 503s returned when the retries are exhausted
+TRANSACTION_RETRY_MESSAGE = "The request conflicted with concurrent changes. Please try again."
+
+class TransactionRetriesExhausted(Exception):
+    '''Raised when a transaction kept conflicting with the concurrent ones, the request can be retried later.'''
+
+async def run_in_transaction(work: Callable[[Any], Awaitable[T]]) -> T:
+    '''
+    Run `work(session)` in a transaction & return its result once committed. Transactions that conflict with
+    concurrent ones are retried by the driver, so `work` may run several times: it mustn't have side effects
+    outside the database, those belong after this returns. Errors raised by `work` abort the transaction.
+    Transactions need mongo to run as a replica set.
+    '''
+    async with await mongo_client.client.start_session() as session:
+        try:
+            return await session.with_transaction(work)
+        except PyMongoError as e:
+            if any(e.has_error_label(label) for label in RETRIED_ERROR_LABELS):
+                raise TransactionRetriesExhausted(str(e)) from e
+            raise
@@ -18,6 +18,12 @@ class AssetConfig(MongoBaseModel):
     price: float
     warranty_years: float
     cloned_stocks: List[str] = []
+    # Numeric companions of the spec fields, set on write (see `utils.specs`)
+    RAM_gb: Optional[float]
+    hdd_size_gb: Optional[float]
+    ssd_size_gb: Optional[float]
+    screen_size_in: Optional[float]
+    processor_speed_ghz: Optional[float]
 
     class Config:
         arbitrary_types_allowed = True
@@ -10,6 +10,12 @@ class UserTypeEnum(str, Enum):
     admin="admin"
     user="user"
 
+class SaleAnalyticsGranularityEnum(str, Enum):
+    day="day"
+    week="week"
+    month="month"
+    year="year"
+
 class Sale(MongoBaseModel):
 
     serial: str
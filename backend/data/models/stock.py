@@ -12,9 +12,13 @@ class StockStatusEnum(str, Enum):
     returned="returned"       # stocks must be refurbished before it can be sold
     refurbished="refurbished" # ready for sale at a discounted price
 
-class StockStatus(BaseModel):
-    status: StockStatusEnum = Field(default="new")
+class StockEvent(BaseModel):
+    '''Status change of a stock, kept in the append only `stock_events` collection.'''
+    serial: str
+    status: StockStatusEnum
     date: datetime = Field(default_factory=datetime.utcnow)
+    config_id: Optional[str]
+    created_by: Optional[str]
 
     class Config:
         arbitrary_types_allowed = True
@@ -39,8 +43,15 @@ class Stock(MongoBaseModel):
     serial: str = Field(default_factory=lambda: str(uuid4()))
     purchase_date: datetime
     remarks: str = ""
+    config_id: Optional[str]  # Set from the config the stock was created from
     current_status: StockStatusEnum = Field(default=StockStatusEnum.new)
-    status_history: list[StockStatus] = [StockStatus(status=StockStatusEnum.new, date=datetime.now())]
+    status_date: datetime = Field(default_factory=datetime.utcnow)  # History is kept in `stock_events`
+    # Numeric companions of the spec fields, set on write (see `utils.specs`)
+    RAM_gb: Optional[float]
+    hdd_size_gb: Optional[float]
+    ssd_size_gb: Optional[float]
+    screen_size_in: Optional[float]
+    processor_speed_ghz: Optional[float]
 
     def __getitem__(self, item):
         return getattr(self, item)
@@ -90,7 +101,6 @@ class UpdateStock(MongoBaseModel):
     purchase_date: Optional[datetime]
     remarks: Optional[str]
     current_status: Optional[StockStatusEnum]
-    status_history: Optional[list[StockStatus]]
 
     def __getitem__(self, item):
         return getattr(self, item)
@@ -117,7 +127,19 @@ class UpdateStock(MongoBaseModel):
                 "serial": "123456789",
                 "purchase_date": "2023-06-29 00:55:29.033394",
                 "remarks": "In excellent working condition",
-                "current_status": "new",
-                "status_history": []
+                "current_status": "new"
             }
-        }
\ No newline at end of file
+        }
+
+class BulkStockUpdate(BaseModel):
+    '''Fields to update on the stock with this serial, the stock is moved when `current_status` is provided.'''
+    serial: str
+    update: UpdateStock
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "serial": "123456789",
+                "update": {"current_status": "refurbished", "remarks": "Battery replaced", "price": 42000.0}
+            }
+        }
@@ -0,0 +1,16 @@
+import asyncio
+from data.db.client import mongo_client, build_connection_string
+
+def run_job(job):
+    '''
+    Run a maintenance job outside of the API server. The job is an async function that is 
+    invoked once the mongo client is connected.
+    '''
+    async def runner():
+        await mongo_client.establish_connection(build_connection_string())
+        try:
+            return await job()
+        finally:
+            await mongo_client.close_connection()
+
+    return asyncio.run(runner())
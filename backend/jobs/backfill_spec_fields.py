@@ -0,0 +1,20 @@
+'''
+Set the numeric spec fields (RAM_gb, ssd_size_gb, ..) on the configs & stocks that predate them.
+
+Usage (from the backend directory): python -m jobs.backfill_spec_fields [--recompute]
+'''
+import argparse
+from jobs import run_job
+from data.db.spec_fields import backfill_spec_fields
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recompute", action="store_true", help="Recompute the fields on every document, ex: after the parsing rules changed.")
+    args = parser.parse_args()
+
+    async def main():
+        updated = await backfill_spec_fields(recompute=args.recompute)
+        for collection, count in updated.items():
+            print (f"{collection}: {count} document(s) updated.")
+
+    run_job(main)
@@ -0,0 +1,21 @@
+'''
+Recount the stocks per config & status and report the drift of the inventory counters.
+
+Usage (from the backend directory): python -m jobs.check_inventory_counters [--fix]
+'''
+import argparse
+from jobs import run_job
+from data.db.inventory_counters import check_counters
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fix", action="store_true", help="Overwrite the counters that drifted with the recount.")
+    args = parser.parse_args()
+
+    async def main():
+        drift = await check_counters(fix=args.fix)
+        for d in drift:
+            print (f"{d['config_id']}: {d['status']} expected {d['expected']}, counted {d['actual']}")
+        print (f"{len(drift)} counter(s) drifted{', fixed' if args.fix and drift else ''}.")
+        
+    run_job(main)
@@ -0,0 +1,14 @@
+'''
+Move the `status_history` arrays embedded in the stocks over to the `stock_events` collection.
+
+Usage (from the backend directory): python -m jobs.migrate_status_history
+'''
+from jobs import run_job
+from data.db.stock_events import migrate_status_history
+
+async def main():
+    migrated, written = await migrate_status_history()
+    print (f"{migrated} stock(s) migrated, {written} event(s) written.")
+
+if __name__ == "__main__":
+    run_job(main)
@@ -0,0 +1,14 @@
+'''
+Rebuild the sales analytics rollups from scratch, meant for backfills.
+
+Usage (from the backend directory): python -m jobs.rebuild_sale_rollups
+'''
+from jobs import run_job
+from data.db.sale_rollup import rebuild_sale_rollups
+
+async def main():
+    buckets = await rebuild_sale_rollups()
+    print (f"Sale rollups rebuilt, {buckets} bucket(s) written.")
+
+if __name__ == "__main__":
+    run_job(main)
@@ -1,34 +1,50 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 import uvicorn
 from utils.util import settings
-from data.db.client import mongo_client
+from data.db.client import mongo_client, build_connection_string
+from data.db.indexes import ensure_indexes
+from data.db.bootstrap import run_once
+from data.db.config_cache import config_cache
+from data.db.stock_feed import stock_feed
 from controllers.asset_config import asset_config_router
 from controllers.stock import stock_router
 from controllers.sale import sale_router
 from controllers.user import user_router
+from controllers.admin import admin_router
+from utils.metrics import MetricsMiddleware, render_metrics
+from utils.conditional import ConditionalGetMiddleware
+from utils.security import JWTUtil
+from utils.compression import CompressionMiddleware
 
 app = FastAPI(swagger_ui_parameters={"defaultModelsExpandDepth": 0}, redoc_url=None)
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/", tags=["ping"])
 async def ping():
     return "Up & running"
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
+
 # Include all routes
 app.include_router(asset_config_router)
 app.include_router(stock_router)
 app.include_router(sale_router)
 app.include_router(user_router)
+app.include_router(admin_router)
 
-@app.on_event("startup")
-async def startup_db_client():
-    USERNAME = settings['MONGO_INITDB_ROOT_USERNAME']
-    PASSWORD = settings['MONGO_INITDB_ROOT_PASSWORD']
-    DB_NAME = settings['MONGO_DB_NAME']
-    URL = settings['MONGO_URL']
+async def bootstrap_database():
+    '''One time setup of the database, run by a single worker per launch.'''
 
-    CONNECTION_STRING = f"mongodb://{USERNAME}:{PASSWORD}@{URL}/{DB_NAME}?authSource=admin&retryWrites=true&w=majority"
-    
-    await mongo_client.establish_connection(CONNECTION_STRING)
+    # Create (or rebuild) the indexes declared in the registry
+    for collection_name, result in (await ensure_indexes(mongo_client.db)).items():
+        for action, index_names in result.items():
+            if index_names:
+                print (f"Indexes {action} on {collection_name}: {', '.join(index_names)}")
 
     # Check if some user exists in the DB, else seed a dummy user
     atleast_one_user = await mongo_client.user.find_one({})
@@ -46,9 +62,20 @@ async def startup_db_client():
     else:
         print ("Dummy user not inserted.")
 
+@app.on_event("startup")
+async def startup_db_client():
+    # Each worker process connects on its own
+    await mongo_client.establish_connection(build_connection_string())
+    await run_once("startup", bootstrap_database)
+    config_cache.start()
+    stock_feed.start()
+    JWTUtil.principal_cache.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await config_cache.stop()
+    await stock_feed.stop()
+    await JWTUtil.principal_cache.stop()
     await mongo_client.close_connection()
 
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+'''
+Production entry point: runs the API with several uvicorn worker processes (`main.py` runs a single
+process, meant for development). Workers are started fresh (spawned, not forked from a process holding a
+mongo client) and connect on their own, the one time bootstrap runs in a single worker under a lock kept
+in mongo. On SIGTERM / SIGINT the workers stop accepting connections and drain the requests in flight for
+upto `GRACEFUL_SHUTDOWN_SECONDS`.
+
+Usage (from the backend directory): python serve.py
+'''
+from uuid import uuid4
+import os
+import tempfile
+import uvicorn
+from utils.util import settings
+
+def worker_count() -> int:
+    '''`WEB_CONCURRENCY` when set, the number of CPUs available to this process otherwise.'''
+    if settings.get("WEB_CONCURRENCY") or os.environ.get("WEB_CONCURRENCY"):
+        return max(1, int(os.environ.get("WEB_CONCURRENCY") or settings["WEB_CONCURRENCY"]))
+    return max(1, len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1))
+
+if __name__ == "__main__":
+    workers = worker_count()
+
+    # Shared by the workers, so the bootstrap runs once for this launch (see `data/db/bootstrap.py`)
+    os.environ["BOOTSTRAP_ID"] = str(uuid4())
+
+    # Metrics of all the workers are aggregated through files in this directory
+    if workers > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+    print (f"Starting {workers} worker(s).")
+    uvicorn.run(
+        "main:app",
+        host=settings["SERVER_HOST"],
+        port=int(settings["SERVER_PORT"]),
+        workers=workers,
+        timeout_graceful_shutdown=int(settings.get("GRACEFUL_SHUTDOWN_SECONDS", 30)),
+        timeout_keep_alive=int(settings.get("KEEP_ALIVE_SECONDS", 5)),
+        proxy_headers=True
+    )
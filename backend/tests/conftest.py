@@ -0,0 +1,21 @@
+'''
+The app reads its settings from the `.env` of the working directory when imported, the tests run in a scratch
+directory with placeholder settings (no mongo is needed, the tests don't touch the database).
+'''
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEST_SETTINGS = {
+    "MONGO_INITDB_ROOT_USERNAME": "test", "MONGO_INITDB_ROOT_PASSWORD": "test", "MONGO_DB_NAME": "test",
+    "MONGO_URL": "localhost:27017", "SERVER_HOST": "127.0.0.1", "SERVER_PORT": "3000", "SERVER_DEBUG_MODE": "False",
+    "HASH_CYRPTCONTEXT.SCHEMES": "bcrypt", "JWT_SECRET_KEY": "test-secret", "JWT_ALGORITHM": "HS256",
+    "JWT_ACCESS_TOKEN_EXPIRE_MINUTES": "30"
+}
+
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
+with open(".env", "w") as f:
+    f.writelines(f"{key}={value}\n" for key, value in TEST_SETTINGS.items())
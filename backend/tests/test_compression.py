@@ -0,0 +1,25 @@
+import pytest
+from utils.compression import negotiate
+
+ENCODINGS = ["br", "zstd", "gzip"]
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("deflate", None),
+    ("", None),
+    ("*", "br"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("*;q=0", None),
+    ("*, br;q=0", "zstd"),
+    ("gzip;q=abc", None),
+    ("gzip; q=0.8", "gzip"),
+])
+def test_negotiate(accept_encoding, expected):
+    assert negotiate(accept_encoding, ENCODINGS) == expected
+
+def test_negotiate_follows_the_server_preference():
+    # Every accepted encoding has the same weight, the server's order breaks the tie
+    assert negotiate("gzip, br", ["gzip", "br"]) == "gzip"
+    assert negotiate("gzip, br", []) is None
@@ -0,0 +1,77 @@
+import datetime as dt
+import re
+import pytest
+from bson import ObjectId
+from data.models.stock import Stock
+from utils.filters import compile_filter, legacy_query, escape, FilterSyntaxError
+
+def test_empty_query():
+    assert compile_filter(Stock, "") == {}
+    assert compile_filter(Stock, "   ") == {}
+
+def test_equality_and_lists():
+    assert compile_filter(Stock, "brand:Acer") == {"brand": "Acer"}
+    assert compile_filter(Stock, "brand:Acer,Dell") == {"brand": {"$in": ["Acer", "Dell"]}}
+    assert compile_filter(Stock, "current_status:new,sold") == {"current_status": {"$in": ["new", "sold"]}}
+
+def test_values_are_converted_to_the_field_type():
+    assert compile_filter(Stock, "price:49990.5") == {"price": 49990.5}
+    assert compile_filter(Stock, "purchase_date:2023-10-10..") == {"purchase_date": {"$gte": dt.datetime(2023, 10, 10)}}
+    oid = ObjectId()
+    assert compile_filter(Stock, f"_id:{oid}") == {"_id": oid}
+
+def test_ranges_and_comparisons():
+    assert compile_filter(Stock, "price:10..20") == {"price": {"$gte": 10.0, "$lte": 20.0}}
+    assert compile_filter(Stock, "price:..20") == {"price": {"$lte": 20.0}}
+    assert compile_filter(Stock, "RAM_gb:>=16") == {"RAM_gb": {"$gte": 16.0}}
+    assert compile_filter(Stock, "RAM_gb:<8") == {"RAM_gb": {"$lt": 8.0}}
+
+def test_prefix_match():
+    assert compile_filter(Stock, "OS:Windows*") == {"OS": {"$regex": "^Windows"}}
+    assert compile_filter(Stock, "processor_type:Intel Core i5-*") == {"processor_type": {"$regex": "^" + re.escape("Intel Core i5-")}}
+
+def test_prefix_match_in_lists():
+    assert compile_filter(Stock, "brand:Acer*,Dell*") == {"brand": {"$in": [re.compile("^Acer"), re.compile("^Dell")]}}
+    assert compile_filter(Stock, "brand:Acer*,HP") == {"brand": {"$in": [re.compile("^Acer"), "HP"]}}
+    assert compile_filter(Stock, "!brand:Acer*,Dell*") == {"brand": {"$nin": [re.compile("^Acer"), re.compile("^Dell")]}}
+
+def test_negation():
+    assert compile_filter(Stock, "!brand:Acer") == {"brand": {"$ne": "Acer"}}
+    assert compile_filter(Stock, "!current_status:sold,deleted") == {"current_status": {"$nin": ["sold", "deleted"]}}
+    assert compile_filter(Stock, "!OS:Windows*") == {"OS": {"$not": {"$regex": "^Windows"}}}
+
+def test_escaping():
+    assert compile_filter(Stock, r"model:Aspire\*") == {"model": "Aspire*"}
+    assert compile_filter(Stock, r"model:A\,B") == {"model": "A,B"}
+    assert compile_filter(Stock, f"model:{escape('x;y|(z):1..2')}") == {"model": "x;y|(z):1..2"}
+
+def test_clauses_and_alternatives():
+    assert compile_filter(Stock, "brand:Acer;price:..60000") == {"brand": "Acer", "price": {"$lte": 60000.0}}
+    assert compile_filter(Stock, "(brand:HP | OS:Ubuntu*)") == {"$or": [{"brand": "HP"}, {"OS": {"$regex": "^Ubuntu"}}]}
+    # Clauses on the same field can't be merged into a single filter
+    assert compile_filter(Stock, "price:>10;price:<20") == {"$and": [{"price": {"$gt": 10.0}}, {"price": {"$lt": 20.0}}]}
+
+def test_compiled_filters_are_copies():
+    compile_filter(Stock, "brand:Acer,Dell")["brand"]["$in"].append("HP")
+    assert compile_filter(Stock, "brand:Acer,Dell") == {"brand": {"$in": ["Acer", "Dell"]}}
+
+@pytest.mark.parametrize("q, error", [
+    ("colour:red", "`colour` can't be filtered on"),
+    ("brand", "Expected `field:value`"),
+    ("price:abc", "`abc` is not a valid value for `price`"),
+    ("current_status:broken", "is not a valid value for `current_status`"),
+    ("price:1..2..3", "Invalid range"),
+    ("price:..", "needs at least one boundary"),
+    ("price:1*", "Prefix match is only supported on text fields"),
+    ("brand:Acer*,1*;price:1*,2", "Prefix match is only supported on text fields"),
+    ("(brand:Acer", "Unbalanced `(`"),
+    ("brand:Acer)", "Unbalanced `)`"),
+])
+def test_errors(q, error):
+    with pytest.raises(FilterSyntaxError, match=re.escape(error)):
+        compile_filter(Stock, q)
+
+def test_legacy_query():
+    assert legacy_query("brand=Acer.Dell, OS=Ubuntu", "40000,80000") == "brand:Acer,Dell;OS:Ubuntu;price:40000..80000"
+    assert legacy_query(price_filter="100000") == "price:100000"
+    assert compile_filter(Stock, legacy_query(dt_filter="2023-10-10,")) == {"purchase_date": {"$gte": dt.datetime(2023, 10, 10)}}
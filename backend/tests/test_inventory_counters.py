@@ -0,0 +1,27 @@
+from data.db.inventory_counters import counter_changes, ALL_CONFIGS, UNASSIGNED
+from data.models.stock import StockStatusEnum
+
+def increments(transitions) -> dict[str, dict[str, int]]:
+    return {change._filter["_id"]: change._doc["$inc"] for change in counter_changes(transitions)}
+
+def test_creation_and_transition():
+    assert increments([("c1", None, StockStatusEnum.new), ("c1", "new", "sold")]) == {
+        "c1": {"counts.sold": 1}, ALL_CONFIGS: {"counts.sold": 1}
+    }
+
+def test_hard_delete():
+    assert increments([("c1", "returned", None)]) == {"c1": {"counts.returned": -1}, ALL_CONFIGS: {"counts.returned": -1}}
+
+def test_changes_across_configs_cancel_out_in_the_total():
+    assert increments([("c1", "new", None), ("c2", None, "new")]) == {"c1": {"counts.new": -1}, "c2": {"counts.new": 1}}
+
+def test_stocks_without_config():
+    assert increments([(None, None, "new")]) == {UNASSIGNED: {"counts.new": 1}, ALL_CONFIGS: {"counts.new": 1}}
+
+def test_no_changes():
+    assert counter_changes([]) == []
+    assert counter_changes([("c1", "new", "new")]) == []
+
+def test_counters_are_upserted():
+    change, _ = counter_changes([("c1", None, "new")])
+    assert change._upsert and "update_date" in change._doc["$set"]
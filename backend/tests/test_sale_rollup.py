@@ -0,0 +1,35 @@
+import datetime as dt
+from data.db.sale_rollup import rollup_changes
+
+ACER = {"brand": "Acer", "model": "Aspire", "serial": "1"}
+DELL = {"brand": "Dell", "model": "Inspiron", "serial": "2"}
+
+def buckets(entries) -> dict[tuple, dict[str, float]]:
+    return {
+        (change._filter["day"], change._filter["brand"], change._filter["model"]): change._doc["$inc"]
+        for change in rollup_changes(entries)
+    }
+
+def test_sales_are_bucketed_per_day_and_stock():
+    assert buckets([
+        (dt.datetime(2023, 10, 10, 9), ACER, 50000.0, 1), (dt.datetime(2023, 10, 10, 18), ACER, 48000.0, 1),
+        (dt.datetime(2023, 10, 11, 9), ACER, 50000.0, 1), (dt.datetime(2023, 10, 10, 9), DELL, 60000.0, 1)
+    ]) == {
+        (dt.datetime(2023, 10, 10), "Acer", "Aspire"): {"revenue": 98000.0, "units": 2},
+        (dt.datetime(2023, 10, 11), "Acer", "Aspire"): {"revenue": 50000.0, "units": 1},
+        (dt.datetime(2023, 10, 10), "Dell", "Inspiron"): {"revenue": 60000.0, "units": 1},
+    }
+
+def test_reversed_sales():
+    # A swap reverses the sale of one stock & records the sale of another, on the original sale date
+    assert buckets([(dt.datetime(2023, 10, 10), ACER, 50000.0, -1), (dt.datetime(2023, 10, 10), DELL, 50000.0, 1)]) == {
+        (dt.datetime(2023, 10, 10), "Acer", "Aspire"): {"revenue": -50000.0, "units": -1},
+        (dt.datetime(2023, 10, 10), "Dell", "Inspiron"): {"revenue": 50000.0, "units": 1},
+    }
+
+def test_entries_that_cancel_out_are_skipped():
+    assert rollup_changes([(dt.datetime(2023, 10, 10), ACER, 50000.0, 1), (dt.datetime(2023, 10, 10), ACER, 50000.0, -1)]) == []
+    assert rollup_changes([]) == []
+
+def test_missing_dimensions():
+    assert buckets([(dt.datetime(2023, 10, 10), {}, 100.0, 1)]) == {(dt.datetime(2023, 10, 10), None, None): {"revenue": 100.0, "units": 1}}
@@ -0,0 +1,34 @@
+import pytest
+from utils.specs import normalize_specs, parse_quantity, SPEC_FIELDS
+
+@pytest.mark.parametrize("field, text, expected", [
+    ("RAM", "16 GB", 16.0),
+    ("RAM", "16GB", 16.0),
+    ("RAM", "512 MB", 0.5),
+    ("RAM", "8", 8.0),
+    ("ssd_size", "1 TB", 1000.0),
+    ("ssd_size", "1,024 GB", 1024.0),
+    ("ssd_size", "NA", None),
+    ("hdd_size", "", None),
+    ("hdd_size", None, None),
+    ("screen_size", "15.6 inches", 15.6),
+    ("screen_size", '14"', 14.0),
+    ("screen_size", "35.56 cm", 14.0),
+    ("processor_speed", "4.4 GHz ", 4.4),
+    ("processor_speed", "2400 MHz", 2.4),
+    ("processor_speed", "3 furlongs", None),
+])
+def test_parse_quantity(field, text, expected):
+    _, units, default_unit = SPEC_FIELDS[field]
+    assert parse_quantity(text, units, default_unit) == expected
+
+def test_normalize_specs():
+    document = {"RAM": "16 GB", "ssd_size": "512 GB", "hdd_size": "NA", "brand": "Acer"}
+    assert normalize_specs(document) is document
+    assert document == {
+        "RAM": "16 GB", "RAM_gb": 16.0, "ssd_size": "512 GB", "ssd_size_gb": 512.0, "hdd_size": "NA", "hdd_size_gb": None,
+        "brand": "Acer"
+    }
+
+def test_partial_updates_only_touch_the_fields_present():
+    assert normalize_specs({"price": 1.0}) == {"price": 1.0}
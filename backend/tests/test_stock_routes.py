@@ -0,0 +1,59 @@
+'''
+Requests through the app, with the database calls of the listing replaced. Sent with httpx's ASGI transport,
+starlette's TestClient doesn't support the locked httpx.
+'''
+import asyncio
+import datetime as dt
+import re
+from types import SimpleNamespace
+import pytest
+import httpx
+from main import app
+from utils.security import JWTUtil
+from data.db.client import mongo_client
+import controllers.stock
+import utils.conditional
+
+def get(path: str, params: dict[str, str]) -> httpx.Response:
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, params=params)
+    return asyncio.run(send())
+
+STOCK = {"serial": "SN-1", "brand": "Acer", "price": 49990.0, "current_status": "new"}
+
+@pytest.fixture
+def queries(monkeypatch) -> list[dict]:
+    '''Filters of the listings queried through the client.'''
+    received: list[dict] = []
+
+    async def paginate(collection, filters, projection, sort, limit, after):
+        received.append(filters)
+        return [dict(STOCK)], None
+
+    async def current_versions(*collections):
+        return {name: (1, dt.datetime(2023, 10, 10)) for name in collections}
+
+    monkeypatch.setattr(controllers.stock, "paginate", paginate)
+    monkeypatch.setattr(utils.conditional, "current_versions", current_versions)
+    monkeypatch.setattr(mongo_client, "reporting", SimpleNamespace(stock=None), raising=False)
+    app.dependency_overrides[JWTUtil.get_current_user] = lambda: {"username": "test", "type": "owner", "disabled": False}
+    yield received
+    app.dependency_overrides.clear()
+
+def test_filter_query(queries):
+    response = get("/stock/", params={"q": "brand:Acer*,Dell;price:..60000"})
+    assert response.status_code == 200
+    assert response.json()["content"] == [STOCK]
+    assert queries == [{"brand": {"$in": [re.compile("^Acer"), "Dell"]}, "price": {"$lte": 60000.0}}]
+
+def test_filter_query_combined_with_the_legacy_filters(queries):
+    response = get("/stock/", params={"q": "current_status:new", "in_filters": "brand=Acer.Dell"})
+    assert response.status_code == 200
+    assert queries == [{"current_status": "new", "brand": {"$in": ["Acer", "Dell"]}}]
+
+def test_invalid_filter_query(queries):
+    response = get("/stock/", params={"q": "colour:red"})
+    assert response.status_code == 400
+    assert "`colour` can't be filtered on" in response.json()["message"]
+    assert queries == []
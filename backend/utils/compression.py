@@ -0,0 +1,145 @@
+'''
+Negotiated compression of the response bodies. gzip is always available, brotli (`br`) & zstd are used
+when the `brotli` / `zstandard` packages are installed. The encoding is picked from the client's
+`Accept-Encoding` in the order of `COMPRESSION_ENCODINGS`, bodies under `COMPRESSION_MINIMUM_SIZE` are
+sent as they are. Streamed responses (exports, server sent events) are never buffered & pass through untouched.
+'''
+from typing import Callable
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+from utils.util import settings
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MINIMUM_SIZE = int(settings.get("COMPRESSION_MINIMUM_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(settings.get("COMPRESSION_GZIP_LEVEL", 1))
+COMPRESSION_BROTLI_QUALITY = int(settings.get("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_ZSTD_LEVEL = int(settings.get("COMPRESSION_ZSTD_LEVEL", 3))
+
+# Bodies larger than this are compressed on a worker thread (zlib & co release the GIL), not on the event loop
+THREADED_COMPRESSION_SIZE = 256 * 1024
+
+# Content types that are already compressed or are streamed to the client as they're produced
+SKIPPED_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+def _compressors() -> dict[str, Callable[[bytes], bytes]]:
+    '''Available encodings -> compression function.'''
+    compressors = {"gzip": lambda body: gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        compressors["zstd"] = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress
+    return compressors
+
+COMPRESSORS = _compressors()
+
+# Encodings in the order of preference, the ones that aren't installed are left out
+ENCODINGS = [
+    encoding for encoding in (e.strip() for e in settings.get("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(","))
+    if encoding in COMPRESSORS
+]
+
+def negotiate(accept_encoding: str, encodings: list[str] = ENCODINGS) -> str | None:
+    '''Preferred encoding accepted by the client (`Accept-Encoding`, with its q-values), None to send the body as is.'''
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def _weaken_etag(headers: MutableHeaders):
+    # The compressed bytes differ from the identity ones, only a weak match holds across the encodings
+    if headers.get("etag", "").startswith('"'):
+        headers["ETag"] = "W/" + headers["etag"]
+
+def _add_vary(headers: MutableHeaders):
+    vary = [v.strip() for v in headers.get("vary", "").split(",") if v.strip()]
+    if "accept-encoding" not in (v.lower() for v in vary):
+        headers["Vary"] = ", ".join([*vary, "Accept-Encoding"])
+
+class CompressionMiddleware:
+    '''
+    ASGI middleware compressing the bodies sent in a single message. The start of the response is held back
+    until the first body message: a body sent in several messages is streamed and is passed on unchanged.
+    '''
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", "")) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or content_type.startswith(SKIPPED_CONTENT_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start.setdefault("headers", []))
+            _add_vary(headers)
+
+            if start["status"] == 304:
+                # Answers for the (compressed) representation the client holds
+                _weaken_etag(headers)
+
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed, or too small to be worth it
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compress = COMPRESSORS[encoding]
+            body = await run_in_threadpool(compress, body) if len(body) > THREADED_COMPRESSION_SIZE else compress(body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            _weaken_etag(headers)
+            passthrough = True
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
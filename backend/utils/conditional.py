@@ -0,0 +1,82 @@
+'''
+Conditional GETs for the polled listings. The `ETag` is derived from the versions of the collections
+that the route reads (bumped by every write) along with the request's path & query, so a matching
+`If-None-Match` is answered with a 304 before any query is made or anything is serialized.
+'''
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import HTTPException, Request, status
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+from data.db.collection_versions import current_versions
+from utils.util import settings
+import datetime as dt
+import hashlib
+
+_STATE_KEY = "conditional_headers"
+
+# The versions are read from the primary, a secondary serving the reporting reads may still be behind them
+REPORTING_READS_PRIMARY = settings.get("MONGO_REPORTING_READ_PREFERENCE", "primary") == "primary"
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, the tag is weakened (`W/`) when the response is compressed
+    return if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+class ConditionalGet:
+    '''
+    Route dependency, list it after the authentication dependency. Answers with a 304 when the client's copy is
+    current, otherwise leaves the `ETag` & `Last-Modified` headers for `ConditionalGetMiddleware` to add.
+    Pass `reporting` for the routes reading through `mongo_client.reporting`, conditional GETs are turned off
+    for those when the reporting reads can be served by secondaries.
+    '''
+
+    def __init__(self, *collections: str, reporting: bool = False):
+        self.collections = collections
+        self.enabled = REPORTING_READS_PRIMARY or not reporting
+
+    async def __call__(self, request: Request):
+        if not self.enabled:
+            return
+        versions = await current_versions(*self.collections)
+        query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+        # The credentials are part of the tag, the same url can answer differently for another user
+        tag = f"{request.headers.get('authorization', '')}|{request.url.path}?{query}|" + "|".join(f"{name}:{version}" for name, (version, _) in sorted(versions.items()))
+        etag = '"' + hashlib.sha1(tag.encode()).hexdigest() + '"'
+        last_modified = max(modified for _, modified in versions.values()).replace(tzinfo=dt.timezone.utc)
+        headers = {"ETag": etag, "Last-Modified": format_datetime(last_modified, usegmt=True), "Cache-Control": "private, no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            not_modified = _matches(if_none_match, etag)
+        elif if_modified_since:
+            try:
+                not_modified = last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                not_modified = False
+        else:
+            not_modified = False
+
+        if not_modified:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        setattr(request.state, _STATE_KEY, headers)
+
+class ConditionalGetMiddleware:
+    '''Adds the headers left by `ConditionalGet` to the successful responses.'''
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        # Shared with the request state of the route, so the dependency's headers can be picked up here
+        state = scope.setdefault("state", {})
+
+        async def send_wrapper(message: Message):
+            headers = state.get(_STATE_KEY)
+            if message["type"] == "http.response.start" and headers and message["status"] == 200:
+                message["headers"] = [*message.get("headers", []), *((k.lower().encode(), v.encode()) for k, v in headers.items())]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,219 @@
+'''
+Filter language of the list endpoints, compiled into mongo find filters.
+
+    q = clause ; clause ; ...            every clause must match
+    clause = field:value                 equality
+             field:a,b,c                 any of the values ($in)
+             field:10..20                range, boundaries included (either side can be left out)
+             field:>=10 / >10 / <=10 / <10
+             field:abc*                  prefix match, for text fields (also within lists: `field:ab*,cd*`)
+             !field:value                negation of any of the above
+             (clause | clause | ...)     any of the clauses ($or)
+
+Values are converted to the type of the model field (ex: `price:49990.5`, `purchase_date:2023-10-10..`),
+the characters `;,|()*:!\\` and `..` can be escaped with a backslash. Compiled filters are cached by the
+raw query string, so repeated queries skip the parsing altogether.
+'''
+from copy import deepcopy
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable
+from bson import ObjectId
+from bson.errors import InvalidId
+import datetime as dt
+import re
+
+MAX_CACHED_FILTERS = 1024
+_SPECIAL = set(";,|()*:!\\<>=.")
+
+class FilterSyntaxError(ValueError):
+    '''Raised when a query can't be compiled, the message points at the offending clause.'''
+
+@lru_cache(maxsize=None)
+def get_class_attributes(clz) -> tuple[str, ...]:
+    return tuple(clz.__fields__.keys())
+
+def _to_float(value: str) -> float:
+    return float(value)
+
+def _to_bool(value: str) -> bool:
+    if value.lower() not in ("true", "false"):
+        raise ValueError(f"`{value}` is not a boolean")
+    return value.lower() == "true"
+
+def _to_object_id(value: str) -> ObjectId:
+    try:
+        return ObjectId(value)
+    except InvalidId as e:
+        raise ValueError(str(e))
+
+def _to_enum(enum: type[Enum]) -> Callable[[str], str]:
+    def convert(value: str) -> str:
+        return enum(value).value
+    return convert
+
+@lru_cache(maxsize=None)
+def field_map(model) -> dict[str, Callable[[str], Any]]:
+    '''Field name -> value converter for the fields of the model, along with `_id`.'''
+    converters: dict[str, Callable[[str], Any]] = {"_id": _to_object_id}
+    for name, field in model.__fields__.items():
+        if isinstance(field.type_, type) and issubclass(field.type_, Enum):
+            converters[name] = _to_enum(field.type_)
+        elif field.type_ in (float, int):
+            converters[name] = _to_float
+        elif field.type_ is bool:
+            converters[name] = _to_bool
+        elif field.type_ is dt.datetime:
+            converters[name] = dt.datetime.fromisoformat
+        else:
+            converters[name] = str
+    return converters
+
+def _split(text: str, separator: str, nested: bool = False) -> list[str]:
+    '''Split on the separator, skipping the escaped ones (and those within parentheses when `nested`).'''
+    parts: list[str] = []
+    depth, start, i = 0, 0, 0
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if nested and text[i] == "(":
+            depth += 1
+        elif nested and text[i] == ")":
+            depth -= 1
+            if depth < 0:
+                raise FilterSyntaxError(f"Unbalanced `)` in `{text}`.")
+        elif depth == 0 and text.startswith(separator, i):
+            parts.append(text[start:i])
+            i = start = i + len(separator)
+            continue
+        i += 1
+    if depth:
+        raise FilterSyntaxError(f"Unbalanced `(` in `{text}`.")
+    parts.append(text[start:])
+    return parts
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+def escape(value: str) -> str:
+    '''Escape a literal value so that it can be embedded in a query.'''
+    return "".join("\\" + c if c in _SPECIAL else c for c in value)
+
+def _convert(convert: Callable[[str], Any], field: str, value: str) -> Any:
+    try:
+        return convert(_unescape(value.strip()))
+    except ValueError:
+        raise FilterSyntaxError(f"`{_unescape(value.strip())}` is not a valid value for `{field}`.")
+
+def _value(field: str, convert: Callable[[str], Any], value: str) -> Any:
+    '''A single value of a list, prefix matches are compiled to regexes so that they can be part of an `$in`.'''
+    value = value.strip()
+    if value.endswith("*") and not value.endswith("\\*"):
+        if convert is not str:
+            raise FilterSyntaxError(f"Prefix match is only supported on text fields, not on `{field}`.")
+        return re.compile("^" + re.escape(_unescape(value[:-1])))
+    return _convert(convert, field, value)
+
+def _condition(field: str, convert: Callable[[str], Any], value: str) -> dict[str, Any] | Any:
+    value = value.strip()
+    for op, operator in ((">=", "$gte"), ("<=", "$lte"), (">", "$gt"), ("<", "$lt")):
+        if value.startswith(op):
+            return {operator: _convert(convert, field, value[len(op):])}
+
+    bounds = _split(value, "..")
+    if len(bounds) == 2:
+        condition = {
+            operator: _convert(convert, field, bound)
+            for operator, bound in (("$gte", bounds[0]), ("$lte", bounds[1])) if bound.strip()
+        }
+        if not condition:
+            raise FilterSyntaxError(f"Range on `{field}` needs at least one boundary.")
+        return condition
+    if len(bounds) > 2:
+        raise FilterSyntaxError(f"Invalid range `{value}` for `{field}`.")
+
+    values = [_value(field, convert, v) for v in _split(value, ",")]
+    if len(values) > 1:
+        return {"$in": values}
+    if isinstance(values[0], re.Pattern):
+        return {"$regex": values[0].pattern}
+    return values[0]
+
+def _negate(condition: dict[str, Any] | Any) -> dict[str, Any]:
+    if not isinstance(condition, dict):
+        return {"$ne": condition}
+    if "$in" in condition:
+        return {"$nin": condition["$in"]}
+    return {"$not": condition}
+
+def _clause(text: str, fields: dict[str, Callable[[str], Any]]) -> dict[str, Any]:
+    alternatives = _split(text, "|", nested=True)
+    if len(alternatives) > 1:
+        return {"$or": [_clause(t, fields) for t in alternatives]}
+
+    text = text.strip()
+    if text.startswith("(") and text.endswith(")"):
+        return _expression(text[1:-1], fields)
+
+    negate = text.startswith("!")
+    parts = _split(text[1:] if negate else text, ":")
+    if len(parts) < 2:
+        raise FilterSyntaxError(f"Expected `field:value`, got `{text}`.")
+    field, value = parts[0].strip(), ":".join(parts[1:])
+    if field not in fields:
+        raise FilterSyntaxError(f"`{field}` can't be filtered on. Choose one of: {', '.join(fields)}.")
+
+    condition = _condition(field, fields[field], value)
+    return {field: _negate(condition) if negate else condition}
+
+def _expression(text: str, fields: dict[str, Callable[[str], Any]]) -> dict[str, Any]:
+    clauses = [_clause(c, fields) for c in _split(text, ";", nested=True) if c.strip()]
+
+    # Merge the clauses into a single filter, unless they touch the same field
+    merged: dict[str, Any] = {}
+    for clause in clauses:
+        if any(k in merged for k in clause):
+            return {"$and": clauses}
+        merged.update(clause)
+    return merged
+
+@lru_cache(maxsize=MAX_CACHED_FILTERS)
+def _compile(model, q: str) -> dict[str, Any]:
+    return _expression(q, field_map(model))
+
+def compile_filter(model, q: str) -> dict[str, Any]:
+    '''
+    Compile the query into a mongo find filter over the fields of the model. Raises FilterSyntaxError
+    (a ValueError) on invalid queries. The returned filter is a copy, callers are free to modify it.
+    '''
+    return deepcopy(_compile(model, q.strip())) if q.strip() else {}
+
+def legacy_query(in_filter_str: str = "", price_filter: str = "", dt_filter: str = "", dt_field_name: str = "purchase_date") -> str:
+    '''
+    Translate the older `in_filters`, `price_filter` & date filter parameters into the filter language,
+    so that they are served by the same compiled filters.
+    '''
+    clauses: list[str] = []
+    for f in filter(None, map(str.strip, in_filter_str.split(","))):
+        field, _, values = f.partition("=")
+        clauses.append(f"{field.strip()}:{','.join(escape(v.strip()) for v in values.split('.'))}")
+
+    for field, bounds in (("price", price_filter), (dt_field_name, dt_filter)):
+        if bounds.strip():
+            lower, _, upper = bounds.partition(",")
+            clauses.append(f"{field}:{escape(lower.strip())}..{escape(upper.strip())}" if "," in bounds else f"{field}:{escape(bounds.strip())}")
+
+    return ";".join(clauses)
+
+@lru_cache(maxsize=MAX_CACHED_FILTERS)
+def _projection(model, projection_str: str) -> tuple[str, ...]:
+    attrs = get_class_attributes(model)
+    return tuple(k for k in map(str.strip, projection_str.split(",")) if k in attrs)
+
+def parse_projections(projection_str: str, model) -> dict[str, int]:
+    '''
+    Utility function to parse the list of attributes and return a dict suitable for
+    passing as the projection attribute to mongo find query.
+    '''
+    return {k: 1 for k in _projection(model, projection_str)}
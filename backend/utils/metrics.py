@@ -0,0 +1,174 @@
+'''
+Prometheus metrics of the HTTP routes & of the mongo commands / connection pool, exposed on `/metrics`.
+When the API runs with several worker processes, set `PROMETHEUS_MULTIPROC_DIR` (an empty directory)
+so that the metrics of all the workers are aggregated.
+'''
+from contextvars import ContextVar
+from typing import Any
+import os
+import threading
+import time
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from pymongo import monitoring
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNMATCHED_ROUTE = "unmatched"
+
+# Route template of the request being served, read by the mongo command listeners (ex: the slow query log)
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time taken to serve the HTTP requests.", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being served.", ["method", "route"], multiprocess_mode="livesum"
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Size of the HTTP response bodies.", ["method", "route"], buckets=SIZE_BUCKETS
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "Time taken by the mongo commands.", ["collection", "command"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_ERRORS = Counter("mongo_command_errors_total", "Mongo commands that failed.", ["collection", "command"])
+MONGO_POOL_CHECKOUT_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool.", ["address"], buckets=LATENCY_BUCKETS
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections", "Connections of the mongo pool, in use & in total.", ["address", "state"], multiprocess_mode="livesum"
+)
+
+def route_template(app: ASGIApp, scope: Scope) -> str:
+    '''Path template of the route serving the request (ex: `/stock/{serial}`), keeps the label cardinality bounded.'''
+    partial = UNMATCHED_ROUTE
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+        if match == Match.PARTIAL and partial == UNMATCHED_ROUTE:
+            partial = getattr(route, "path", UNMATCHED_ROUTE)  # Path matched but not the method, ex: 405s
+    return partial
+
+class MetricsMiddleware:
+    '''ASGI middleware recording the latency, in flight requests & response size of every HTTP request.'''
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope.get("app"), scope)  # Set to the FastAPI app before the middlewares are called
+        status_code, size = 500, 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        token = current_route.set(f"{method} {route}")
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_route.reset(token)
+            HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(time.perf_counter() - start)
+            HTTP_RESPONSE_SIZE.labels(method, route).observe(size)
+            in_progress.dec()
+
+class CommandMetricsListener(monitoring.CommandListener):
+    '''Latency & errors of the mongo commands, per collection & command.'''
+
+    def __init__(self):
+        # The collection is only part of the started event, kept until the command completes
+        self._collections: dict[tuple[Any, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else event.database_name
+
+    def _collection(self, event) -> str:
+        return self._collections.pop((event.connection_id, event.request_id), "unknown")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        MONGO_COMMAND_DURATION.labels(self._collection(event), event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self._collection(event)
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_ERRORS.labels(collection, event.command_name).inc()
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    '''
+    Checkout wait times & connection counts of the mongo pool. Checkouts are started & completed on the
+    same (executor) thread, the start time is kept in a thread local.
+    '''
+
+    def __init__(self):
+        self._checkout = threading.local()
+
+    def _address(self, event) -> str:
+        return "%s:%s" % event.address
+
+    def connection_check_out_started(self, event):
+        self._checkout.start = time.perf_counter()
+
+    def _observe_wait(self, event):
+        start = getattr(self._checkout, "start", None)
+        if start is not None:
+            MONGO_POOL_CHECKOUT_WAIT.labels(self._address(event)).observe(time.perf_counter() - start)
+            self._checkout.start = None
+
+    def connection_checked_out(self, event):
+        self._observe_wait(event)
+        MONGO_POOL_CONNECTIONS.labels(self._address(event), "in_use").inc()
+
+    def connection_check_out_failed(self, event):
+        self._observe_wait(event)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event), "in_use").dec()
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event), "total").inc()
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event), "total").dec()
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+def mongo_listeners() -> list[monitoring.CommandListener | monitoring.ConnectionPoolListener]:
+    '''Listeners to register on the mongo client.'''
+    return [CommandMetricsListener(), PoolMetricsListener()]
+
+def render_metrics() -> tuple[bytes, str]:
+    '''The metrics in the Prometheus text format, along with the content type.'''
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
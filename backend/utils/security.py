@@ -1,4 +1,6 @@
+import asyncio
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Annotated
 from pydantic import BaseModel
 
@@ -10,12 +12,24 @@ import jose.jwt
 
 from utils.util import settings
 from data.db.client import mongo_client
+from data.db.cache import LRUCache
 from data.models.user import User, UserTypeEnum
 
 ## Password hasing related
 class HashUtil:
     pwd_context = CryptContext(schemes=settings["HASH_CYRPTCONTEXT.SCHEMES"].split(","), deprecated='auto')
 
+    # bcrypt releases the GIL, so a small thread pool hashes in parallel without blocking the event loop
+    MAX_CONCURRENCY = int(settings.get("HASH_MAX_CONCURRENCY", 2))
+    _executor: ThreadPoolExecutor | None = None
+    _semaphore: asyncio.Semaphore | None = None
+
+    # Queue depth metrics
+    waiting = 0
+    peak_waiting = 0
+    running = 0
+    completed = 0
+
     @staticmethod
     def get_password_hash(password: str) -> str:
         return HashUtil.pwd_context.hash(password)
@@ -24,6 +38,54 @@ class HashUtil:
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         return HashUtil.pwd_context.verify(plain_password, hashed_password)
 
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        return await HashUtil._run_in_pool(HashUtil.get_password_hash, password)
+
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        return await HashUtil._run_in_pool(HashUtil.verify_password, plain_password, hashed_password)
+
+    @staticmethod
+    async def _run_in_pool(fn, *args):
+        '''Run the hashing function in the bounded pool, callers over the concurrency cap wait their turn.'''
+        if HashUtil._executor is None:
+            HashUtil._executor = ThreadPoolExecutor(max_workers=HashUtil.MAX_CONCURRENCY, thread_name_prefix="password-hash")
+            HashUtil._semaphore = asyncio.Semaphore(HashUtil.MAX_CONCURRENCY)
+
+        HashUtil.waiting += 1
+        HashUtil.peak_waiting = max(HashUtil.peak_waiting, HashUtil.waiting)
+        try:
+            await HashUtil._semaphore.acquire()
+        finally:
+            HashUtil.waiting -= 1
+
+        HashUtil.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(HashUtil._executor, fn, *args)
+        finally:
+            HashUtil.running -= 1
+            HashUtil.completed += 1
+            HashUtil._semaphore.release()
+
+    @staticmethod
+    def stats() -> dict[str, int]:
+        return {
+            "max_concurrency": HashUtil.MAX_CONCURRENCY, "running": HashUtil.running, "waiting": HashUtil.waiting, 
+            "peak_waiting": HashUtil.peak_waiting, "completed": HashUtil.completed
+        }
+
+## Authenticated user cache
+class PrincipalCache(LRUCache):
+    '''
+    Users resolved from access tokens, keyed by the token subject. Any change to the users clears the cache
+    of every worker, so disabling an user takes effect right away everywhere.
+    '''
+
+    def start(self):
+        # The change events only carry the `_id`, user writes are rare enough to drop all of them
+        self.watch(mongo_client.user, [{"$project": {"operationType": 1}}], lambda change: self.invalidate(), "principal cache")
+
 ## Json Web Token related
 class JWTUtil:
 
@@ -31,6 +93,10 @@ class JWTUtil:
     SECRET_KEY = settings["JWT_SECRET_KEY"]
     ALGORITHM = settings["JWT_ALGORITHM"]
     ACCESS_TOKEN_EXPIRE_MINUTES = int(settings["JWT_ACCESS_TOKEN_EXPIRE_MINUTES"])
+    principal_cache = PrincipalCache(
+        max_size=int(settings.get("PRINCIPAL_CACHE_MAX_SIZE", 1024)), 
+        ttl=float(settings.get("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+    )
 
     class TokenModel(BaseModel):
         access_token: str
@@ -59,9 +125,17 @@ class JWTUtil:
     async def get_current_user(token: str = Depends(oauth2_scheme)):
         payload = JWTUtil.parse_access_token(token)
         username: str = payload.get("sub") or "" if payload else ""
-        user_in_db = await mongo_client.user.find_one({"username": username}, {"password": 0}) if username else None
+        user_in_db = JWTUtil.principal_cache.get(username) if username else None
+        if username and not user_in_db:
+            generation = JWTUtil.principal_cache.generation
+            user_in_db = await mongo_client.user.find_one({"username": username}, {"password": 0})
+            if user_in_db:
+                JWTUtil.principal_cache.put(username, user_in_db, generation)
         if (user_in_db and not user_in_db["disabled"]):
 
+            # Handlers get their own copy, the cached user is shared across requests
+            user_in_db = dict(user_in_db)
+
             # These fields are used when trying to add the audit fields during updates
             user_in_db["AH_DATE"] = dt.datetime.utcnow
             user_in_db["AH_USER"] = user_in_db["username"]
@@ -0,0 +1,32 @@
+'''
+Normalization of the free text specification fields (ex: "16 GB", "4.4 GHz ") into numeric companion
+fields, so that they can be range filtered & indexed (ex: `RAM_gb:>=16;ssd_size_gb:>=512`).
+'''
+from typing import Any
+import re
+
+# Text field -> (numeric field, unit -> multiplier into the unit of the numeric field, unit assumed when left out)
+SPEC_FIELDS: dict[str, tuple[str, dict[str, float], str]] = {
+    "RAM": ("RAM_gb", {"mb": 1 / 1024, "gb": 1, "g": 1, "tb": 1024}, "gb"),
+    "hdd_size": ("hdd_size_gb", {"mb": 1 / 1000, "gb": 1, "g": 1, "tb": 1000, "t": 1000}, "gb"),
+    "ssd_size": ("ssd_size_gb", {"mb": 1 / 1000, "gb": 1, "g": 1, "tb": 1000, "t": 1000}, "gb"),
+    "screen_size": ("screen_size_in", {"inches": 1, "inch": 1, "in": 1, '"': 1, "''": 1, "cm": 1 / 2.54}, "in"),
+    "processor_speed": ("processor_speed_ghz", {"mhz": 1 / 1000, "ghz": 1}, "ghz"),
+}
+
+_QUANTITY = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z\"']*)")
+
+def parse_quantity(text: Any, units: dict[str, float], default_unit: str) -> float | None:
+    '''Numeric value of the first quantity in the text, None when there is none (ex: "NA") or the unit is unknown.'''
+    match = _QUANTITY.search(str(text or "").lower().replace(",", ""))
+    if not match:
+        return None
+    multiplier = units.get(match.group(2).rstrip(".") or default_unit)
+    return round(float(match.group(1)) * multiplier, 3) if multiplier else None
+
+def normalize_specs(document: dict[str, Any]) -> dict[str, Any]:
+    '''Set the numeric companions of the specification fields present in the document, returns the same document.'''
+    for field, (numeric_field, units, default_unit) in SPEC_FIELDS.items():
+        if field in document:
+            document[numeric_field] = parse_quantity(document[field], units, default_unit)
+    return document
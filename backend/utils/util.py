@@ -1,9 +1,22 @@
-from typing import Any
+from typing import Any, AsyncIterator
+from enum import Enum
 from fastapi import status
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, validator
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from bson import json_util, ObjectId, Decimal128
+import pymongo
+import base64
+import orjson
+import csv
+import io
+import codecs
 import datetime as dt
+from data.db.indexes import record_query_shape
+
+class ExportFormatEnum(str, Enum):
+    json="json"       # Paginated JSON envelope
+    ndjson="ndjson"   # Streamed, one JSON document per line
+    csv="csv"         # Streamed, one row per document
 
 def load_dotenv(fp: str) -> dict[str, str]:
     config: dict[str, str] = {}
@@ -15,90 +28,228 @@ def load_dotenv(fp: str) -> dict[str, str]:
 
     return config
 
-def get_class_attributes(clz) -> list[str]:
-    return list(clz.__fields__.keys())
-
-def parse_projections(projection_str: str, attrs: Any) -> dict:
-        '''
-        Utility function to parse the list of attributes and return a dict suitable for 
-        passing as the projection attribute to mongo find query. 
-        '''
-        return {k: 1 for k in filter(lambda x: x in attrs, map(str.strip, projection_str.split(",")))}
-
-def parse_filters(
-        attrs: list[str], in_filter_str: str = "", price_filter: str = "", dt_filter: str = "", 
-        price_field_name: str = "price", dt_field_name: str = "purchase_date"
-    ):
-        
+def parse_sort(sort_str: str, sortable: list[str]) -> tuple[str, int]:
+    '''
+    Utility function to parse the sort parameter (`field` for ascending, `-field` for descending)
+    and return the field name along with the pymongo sort direction. Only fields that are backed
+    by an index should be passed in as `sortable`.
+    '''
+    sort_str = sort_str.strip() or "_id"
+    direction = pymongo.DESCENDING if sort_str.startswith("-") else pymongo.ASCENDING
+    sort_field = sort_str.lstrip("+-")
+    if sort_field not in sortable:
+        raise ValueError(f"Sort field `{sort_field}` is not supported. Choose one of: {', '.join(sortable)}.")
+    return sort_field, direction
+
+def encode_cursor(document: dict[str, Any], sort_field: str) -> str:
+    '''Build an opaque cursor token that points right after the provided document.'''
+    payload = json_util.dumps({"s": sort_field, "v": document.get(sort_field), "id": document["_id"]})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_field: str) -> tuple[Any, Any]:
+    '''Parse a cursor token built by `encode_cursor`, returns the sort value & the `_id` of the last document.'''
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["s"] != sort_field:
+            raise ValueError
+        return payload["v"], payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Cursor provided in `after` is not valid for the requested sort order.")
+
+def keyset_filter(filters: dict, sort_field: str, direction: int, after: str = "") -> dict:
+    '''
+    Utility function to combine the find filters with the keyset condition derived from the
+    `after` cursor. Ties on the sort field are broken using `_id`.
+    '''
+    if not after:
+        return filters
+
+    value, last_id = decode_cursor(after, sort_field)
+    op = "$gt" if direction == pymongo.ASCENDING else "$lt"
+    if sort_field == "_id":
+        page = {"_id": {op: last_id}}
+    else:
+        page = {"$or": [{sort_field: {op: value}}, {sort_field: value, "_id": {op: last_id}}]}
+
+    return {"$and": [filters, page]} if filters else page
+
+async def paginate(
+        collection, filters: dict, projection: dict, sort: tuple[str, int], limit: int, after: str = ""
+    ) -> tuple[list[dict[str, Any]], str | None]:
     '''
-    Utility function to parse the `in_filters`, `price_filter` & `date_filter` and 
-    based on the input return a dictionary that is in a suitable format for mongo 
-    find query.
+    Fetch a single page of documents using keyset pagination. Returns the documents along with
+    the cursor for the next page (None when there are no further pages). Only `limit + 1`
+    documents are ever read from the cursor.
     '''
+    sort_field, direction = sort
+    if projection:
+        projection = {**projection, sort_field: 1}
+
+    record_query_shape(collection.name, filters, sort_field)
+    cursor = collection.find(keyset_filter(filters, sort_field, direction, after), projection).sort(sort_spec(sort)).limit(limit + 1)
+    documents: list[dict[str, Any]] = await cursor.to_list(length=limit + 1)
+
+    next_cursor = encode_cursor(documents[limit - 1], sort_field) if len(documents) > limit else None
+    return documents[:limit], next_cursor
+
+def sort_spec(sort: tuple[str, int]) -> list[tuple[str, int]]:
+    '''Sort specification for the find query, `_id` is used as the tie breaker.'''
+    sort_field, direction = sort
+    return [(sort_field, direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+
+def _json_default(value: Any) -> Any:
+    '''Encode the types that orjson doesn't support natively (datetime, enums & dicts are handled by orjson).'''
+    if isinstance(value, (ObjectId, Decimal128)):
+        return str(value)
+    elif isinstance(value, BaseModel):
+        return value.dict()
+    elif isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
-    filters = dict()
-
-    # Parse the `in` filters
-    for f in map(str.strip, in_filter_str.split(",")):
-        f = f.split("=")
-        if f[0] in attrs or (f[0] == "price" and not price_filter) or (f[0] == "sale_date" and not dt_filter):
-            filters[f[0]] = {"$in": list(map(str.strip, f[1].split(".")))}
-
-    # Parse in the Price filter
-    if price_filter:
-        if "," in price_filter:
-            pf = dict()
-            price_filter_parsed = list(map(lambda x: float(x.strip()) if x.strip().isnumeric() else None, price_filter.split(",")))
-            if price_filter_parsed[0]:
-                pf["$gte"] = price_filter_parsed[0]
-            if price_filter_parsed[1]:
-                pf["$lte"] = price_filter_parsed[1]
-            filters[price_field_name] = pf
+def dump_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    elif isinstance(value, (dict, list)):
+        return dump_json(value).decode()
+    elif isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    elif isinstance(value, Enum):
+        return value.value
+    return value
+
+async def _ndjson_chunks(cursor) -> AsyncIterator[bytes]:
+    chunk: list[bytes] = []
+    size = 0
+    async for document in cursor:
+        line = dump_json(document)
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield b"\n".join(chunk) + b"\n"
+            chunk, size = [], 0
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+async def _csv_chunks(cursor, columns: list[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for document in cursor:
+        writer.writerow([_csv_value(document.get(column)) for column in columns])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, dict[str, str]]]:
+    '''
+    Incrementally parse a CSV body as it is received, yields the (row number, record) keyed by the 
+    header row. Only the record being parsed is held in memory, quoted values can span lines.
+    '''
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    header: list[str] = []
+    pending, record_lines, row = "", [], 0
+
+    def parse(line: str) -> list[str] | None:
+        record_lines.append(line.rstrip("\r"))
+        record = "\n".join(record_lines)
+        if record.count('"') % 2:
+            return None # Unbalanced quotes, the record continues on the next line
+        record_lines.clear()
+        return next(csv.reader([record]), None)
+
+    async def lines() -> AsyncIterator[str]:
+        nonlocal pending
+        async for chunk in chunks:
+            *complete, pending = (pending + decoder.decode(chunk)).split("\n")
+            for line in complete:
+                yield line
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending
+
+    async for line in lines():
+        values = parse(line)
+        if not values or not any(v.strip() for v in values):
+            continue
+        elif not header:
+            header = [v.strip() for v in values]
         else:
-            filters[price_field_name] = {"$eq": float(price_filter)}
-
-    # Parse in the Date filter
-    if dt_filter:
-        try:
-            if "," in dt_filter:
-                pdf = dict()
-                dt_filter_parsed = list(map(lambda x: dt.datetime.fromisoformat(x.strip()) if x.strip() else None, dt_filter.split(",")))
-                if dt_filter_parsed[0]:
-                    pdf["$gte"] = dt_filter_parsed[0]
-                if dt_filter_parsed[1]:
-                    pdf["$lte"] = dt_filter_parsed[1]
-                filters[dt_field_name] = pdf
-            else:
-                filters[dt_field_name] = {"$eq": dt.datetime.fromisoformat(dt_filter)}
-        except ValueError as e:
-            print (e)
-
-    return filters
+            row += 1
+            yield row, {k: v.strip() for k, v in zip(header, values)}
+
+def stream_export(
+        collection, filters: dict, projection: dict, sort: tuple[str, int], after: str,
+        export_format: ExportFormatEnum, columns: list[str], filename: str
+    ) -> StreamingResponse:
+    '''
+    Stream every document matching the filters as NDJSON or CSV. Documents are written out
+    as they arrive from the cursor, so memory stays flat irrespective of the result size.
+    '''
+    sort_field, direction = sort
+    record_query_shape(collection.name, filters, sort_field)
+    cursor = collection.find(
+        keyset_filter(filters, sort_field, direction, after), projection
+    ).sort(sort_spec(sort)).batch_size(EXPORT_BATCH_SIZE)
+
+    if export_format == ExportFormatEnum.csv:
+        columns = list(projection.keys()) if projection else columns
+        body, media_type = _csv_chunks(cursor, ["_id"] + [c for c in columns if c != "_id"]), "text/csv"
+    else:
+        body, media_type = _ndjson_chunks(cursor), "application/x-ndjson"
+
+    return StreamingResponse(
+        body, media_type=media_type, 
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'}
+    )
+
+class MongoJSONResponse(JSONResponse):
+    '''
+    JSON response that encodes the documents read from mongo (ObjectId, datetime, enums) in a 
+    single pass using orjson, instead of going through `jsonable_encoder` first.
+    '''
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
 
 class ResponseModel(BaseModel):
 
     content: list[dict[str, Any]] | dict[str, Any] = []
     message: str = "Request was successful"
     status_code: int = status.HTTP_200_OK
-
-    @validator("content", pre=True)
-    def _id_cleanup(cls, content: list[dict[str, Any]] | dict[str, Any]):
-        if type(content) == list:
-            for d in content: 
-                if "_id" in d: d["_id"] = str(d["_id"])
-        elif type(content) == dict:
-            if "_id" in content: content["_id"] = str(content["_id"])
-        return content
+    next_cursor: str | None = None
 
     def __new__(cls, *args, **kwargs):
-        return JSONResponse(
-            content={
-                "content": jsonable_encoder(ResponseModel._id_cleanup(kwargs["content"])) if "content" in kwargs else [], 
-                "message": kwargs["message"] if "message" in kwargs else "Request was successful",
-                "status_code": kwargs["status_code"] if "status_code" in kwargs else status.HTTP_200_OK
-            }, 
+        content = {
+            "content": kwargs["content"] if "content" in kwargs else [], 
+            "message": kwargs["message"] if "message" in kwargs else "Request was successful",
+            "status_code": kwargs["status_code"] if "status_code" in kwargs else status.HTTP_200_OK
+        }
+
+        # Paginated responses carry the cursor for the next page
+        if "next_cursor" in kwargs:
+            content["next_cursor"] = kwargs["next_cursor"]
+
+        return MongoJSONResponse(
+            content=content, 
             status_code=kwargs["status_code"] if "status_code" in kwargs else status.HTTP_200_OK
         )
     
 # Load the settings
-settings = load_dotenv(".env")
\ No newline at end of file
+settings = load_dotenv(".env")
+
+# Pagination defaults for the list endpoints
+PAGE_LIMIT_DEFAULT = int(settings.get("PAGINATION_DEFAULT_LIMIT", 100))
+PAGE_LIMIT_MAX = int(settings.get("PAGINATION_MAX_LIMIT", 1000))
+
+# Streaming export tuning, documents fetched per cursor batch & approximate size of the chunks written out
+EXPORT_BATCH_SIZE = int(settings.get("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CHUNK_SIZE = int(settings.get("EXPORT_CHUNK_SIZE", 65536))
+
+# Stocks validated & inserted together by the CSV import
+IMPORT_BATCH_SIZE = int(settings.get("STOCK_IMPORT_BATCH_SIZE", 500))
\ No newline at end of file